@@ -1,18 +1,26 @@
 import serial
 import json
+import os
 import sys
 import time
 import serial.tools.list_ports
 import socket
+from udp_transport import FanOutSender, config_from_env
 
-# UDP setup
-UDP_IP = "255.255.255.255"
+# UDP setup - broadcast by default, see udp_transport.DEFAULT_TRANSPORT for
+# multicast / unicast / unix modes and per-subscriber rates
 UDP_PORT = 5005
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+TRANSPORT = {
+    "mode": "broadcast",
+    "port": UDP_PORT,
+}
+TRANSPORT.update(config_from_env())
 
 BAUD_RATE = 115200
 
+# Identifies this sender to receivers; each source has its own sequence counter
+SOURCE_ID = os.environ.get("UWB_SOURCE_ID", socket.gethostname())
+
 def find_serial_port():
     ports = serial.tools.list_ports.comports()
     for port, desc, hwid in sorted(ports):
@@ -27,6 +35,14 @@ if __name__ == "__main__":
         print("Error: No suitable serial port found.")
         sys.exit(1)
 
+    sender = FanOutSender(TRANSPORT)
+    print(f"Transport: {sender.describe()}")
+
+    # Sequence numbers restart with every run; the session id lets receivers
+    # tell a restart apart from a burst of late packets
+    session = int(time.time() * 1000)
+    seq = 0
+
     try:
         with serial.Serial(PORT, BAUD_RATE, timeout=1) as ser:
             print(f"Connected to {PORT}")
@@ -57,14 +73,21 @@ if __name__ == "__main__":
                         # Create simplified data structure with only essential data
                         raw_data = {
                             "distances": raw_distances,
-                            "timestamp": time.time()
+                            "timestamp": time.time(),
+                            "source": SOURCE_ID,
+                            "session": session,
+                            "seq": seq,
+                            "mono": time.monotonic()
                         }
-                        
-                        sock.sendto(json.dumps(raw_data).encode(), (UDP_IP, UDP_PORT))
+                        seq += 1
+
+                        sender.send(raw_data)
                         print("Sent raw distances:", raw_distances)
 
                 except Exception as e:
                     print("Error in loop:", e)
                     time.sleep(0.1)
     except KeyboardInterrupt:
-        print("Stopped.") 
\ No newline at end of file
+        print("Stopped.")
+    finally:
+        sender.close()
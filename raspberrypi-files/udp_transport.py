@@ -0,0 +1,281 @@
+import json
+import os
+import socket
+import struct
+import time
+
+# Default transport configuration - "broadcast" keeps the original behaviour
+DEFAULT_TRANSPORT = {
+    "mode": "broadcast",        # "broadcast", "multicast", "unicast" or "unix"
+    "port": 5005,
+    # Multicast: one group per output rate, receivers join the group they want
+    "multicast_groups": [
+        {"group": "239.255.50.5", "rate_hz": None},   # full rate
+        {"group": "239.255.50.6", "rate_hz": 5},      # dashboards
+    ],
+    "multicast_ttl": 1,
+    "multicast_interface": "0.0.0.0",
+    # Unicast: static subscribers plus any that register on the control port
+    "subscribers": [
+        # {"host": "192.168.1.20", "port": 5005, "rate_hz": None},
+    ],
+    "control_port": 5006,
+    "subscription_lease": 30.0,  # seconds before a dynamic subscriber expires
+    "max_subscribers": 8,           # dynamic subscribers in total
+    "max_subscribers_per_host": 2,  # dynamic subscribers from one host
+    # Unix: local datagram sockets on the same machine
+    "unix_paths": [
+        # {"path": "/tmp/uwb_positions.sock", "rate_hz": None},
+    ],
+}
+
+
+class RateLimiter:
+    """
+    Decimates a stream to at most rate_hz messages per second.
+    None or 0 means full rate.
+    """
+    def __init__(self, rate_hz=None):
+        self.interval = 1.0 / rate_hz if rate_hz else 0.0
+        self.next_send = 0.0
+
+    def allow(self, now):
+        if self.interval == 0.0:
+            return True
+        if now < self.next_send:
+            return False
+        # Advance on a fixed grid so the output rate does not drift,
+        # but restart the grid after a pause instead of bursting to catch up
+        if now - self.next_send >= self.interval:
+            self.next_send = now
+        self.next_send += self.interval
+        return True
+
+
+class Destination:
+    """
+    A single output address with its own rate limiter
+    """
+    def __init__(self, sock, address, rate_hz=None, expires=None):
+        self.sock = sock
+        self.address = address
+        self.rate_hz = rate_hz
+        self.limiter = RateLimiter(rate_hz)
+        self.expires = expires
+
+    def send(self, payload, now):
+        if not self.limiter.allow(now):
+            return False
+        try:
+            self.sock.sendto(payload, self.address)
+        except OSError as e:
+            # A missing Unix listener or unreachable host must not stop the others
+            print(f"Send to {self.address} failed: {e}")
+            return False
+        return True
+
+
+class FanOutSender:
+    """
+    Sends each message to every configured destination, honouring
+    per-destination rate limits.
+
+    Unicast receivers can subscribe at runtime by sending a JSON datagram
+    to the control port:
+        {"subscribe": {"port": 5005, "rate_hz": 5}}
+    The subscription has to be renewed within the lease time.
+    {"unsubscribe": {"port": 5005}} removes it immediately. New
+    subscriptions beyond max_subscribers (or max_subscribers_per_host from
+    one host) are refused; renewals of existing ones are not.
+    """
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_TRANSPORT)
+        if config:
+            self.config.update(config)
+        self.mode = self.config["mode"]
+        self.port = self.config["port"]
+        self.destinations = []
+        self.dynamic = {}
+        self.sockets = []
+        self.control_sock = None
+
+        if self.mode == "broadcast":
+            sock = self._udp_socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self.destinations.append(Destination(sock, ("255.255.255.255", self.port)))
+        elif self.mode == "multicast":
+            sock = self._udp_socket()
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+                            struct.pack("b", self.config["multicast_ttl"]))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                            socket.inet_aton(self.config["multicast_interface"]))
+            for entry in self.config["multicast_groups"]:
+                self.destinations.append(Destination(
+                    sock, (entry["group"], entry.get("port", self.port)), entry.get("rate_hz")))
+        elif self.mode == "unicast":
+            sock = self._udp_socket()
+            self.unicast_sock = sock
+            for entry in self.config["subscribers"]:
+                self.destinations.append(Destination(
+                    sock, (entry["host"], entry.get("port", self.port)), entry.get("rate_hz")))
+            if self.config["control_port"]:
+                self.control_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.control_sock.bind(("0.0.0.0", self.config["control_port"]))
+                self.control_sock.setblocking(False)
+                self.sockets.append(self.control_sock)
+        elif self.mode == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sockets.append(sock)
+            for entry in self.config["unix_paths"]:
+                self.destinations.append(Destination(sock, entry["path"], entry.get("rate_hz")))
+        else:
+            raise ValueError(f"Unknown transport mode: {self.mode}")
+
+    def _udp_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(sock)
+        return sock
+
+    def describe(self):
+        targets = [f"{d.address} @ {d.rate_hz or 'full'} Hz" for d in self.destinations]
+        if self.control_sock is not None:
+            targets.append(f"subscriptions on UDP {self.config['control_port']}")
+        return f"{self.mode}: " + ", ".join(targets or ["no destinations"])
+
+    def _parse_request(self, request):
+        """
+        Validate a control message. Returns (kind, port, rate_hz) or raises
+        ValueError, so a malformed datagram can never break send().
+        """
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        kind = "subscribe" if "subscribe" in request else "unsubscribe" if "unsubscribe" in request else None
+        if kind is None:
+            raise ValueError("expected 'subscribe' or 'unsubscribe'")
+        req = request[kind] or {}
+        if not isinstance(req, dict):
+            raise ValueError(f"'{kind}' must be an object")
+        port = req.get("port", self.port)
+        if isinstance(port, bool) or not isinstance(port, int) or not 0 < port < 65536:
+            raise ValueError(f"invalid port {port!r}")
+        rate_hz = req.get("rate_hz")
+        if rate_hz is not None and (isinstance(rate_hz, bool) or not isinstance(rate_hz, (int, float))
+                                    or not 0 < rate_hz < float("inf")):
+            raise ValueError(f"invalid rate_hz {rate_hz!r}")
+        return kind, port, rate_hz
+
+    def _check_limits(self, host):
+        """
+        Raise ValueError if a new dynamic subscriber from host would exceed
+        the configured limits
+        """
+        if len(self.dynamic) >= self.config["max_subscribers"]:
+            raise ValueError(f"subscriber limit reached ({self.config['max_subscribers']})")
+        per_host = sum(1 for other, _ in self.dynamic if other == host)
+        if per_host >= self.config["max_subscribers_per_host"]:
+            raise ValueError(f"per-host subscriber limit reached "
+                             f"({self.config['max_subscribers_per_host']})")
+
+    def poll_subscriptions(self, now):
+        """
+        Handle pending subscribe/unsubscribe requests and expire old leases
+        """
+        if self.control_sock is None:
+            return
+        for address, dest in list(self.dynamic.items()):
+            if dest.expires < now:
+                print(f"Subscriber {address} lease expired")
+                del self.dynamic[address]
+
+        while True:
+            try:
+                data, (host, _) = self.control_sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                break
+            try:
+                request = json.loads(data.decode())
+                kind, port, rate_hz = self._parse_request(request)
+                if kind == "subscribe" and (host, port) not in self.dynamic:
+                    self._check_limits(host)
+            except (ValueError, UnicodeDecodeError) as e:
+                print(f"Ignoring bad subscription request from {host}: {e}")
+                continue
+            address = (host, port)
+            if kind == "subscribe":
+                current = self.dynamic.get(address)
+                expires = now + self.config["subscription_lease"]
+                if current is not None and current.rate_hz == rate_hz:
+                    current.expires = expires
+                else:
+                    print(f"Subscriber {address} @ {rate_hz or 'full'} Hz")
+                    self.dynamic[address] = Destination(self.unicast_sock, address, rate_hz, expires)
+            else:
+                if self.dynamic.pop(address, None) is not None:
+                    print(f"Subscriber {address} removed")
+
+    def send(self, message):
+        """
+        Encode message once and fan it out. Returns the number of destinations
+        that actually received it after rate limiting.
+        """
+        now = time.monotonic()
+        self.poll_subscriptions(now)
+        payload = json.dumps(message).encode()
+        sent = 0
+        for dest in self.destinations:
+            sent += dest.send(payload, now)
+        for dest in self.dynamic.values():
+            sent += dest.send(payload, now)
+        return sent
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+
+def subscribe(sender_host, port=5005, rate_hz=None, control_port=5006):
+    """
+    Ask a unicast-mode sender to stream to this host. Call again before
+    the lease runs out to keep the subscription alive.
+    """
+    request = {"subscribe": {"port": port, "rate_hz": rate_hz}}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(json.dumps(request).encode(), (sender_host, control_port))
+
+
+def config_from_env():
+    """
+    Read transport overrides from the environment so the systemd unit can
+    switch modes without editing code, e.g.
+        UWB_TRANSPORT=multicast
+        UWB_TRANSPORT=unicast UWB_SUBSCRIBERS=192.168.1.20:5005,192.168.1.30:5005@5
+        UWB_TRANSPORT=unix UWB_UNIX_PATHS=/tmp/uwb_positions.sock@10
+    """
+    config = {}
+    mode = os.environ.get("UWB_TRANSPORT")
+    if mode:
+        config["mode"] = mode
+    if os.environ.get("UWB_PORT"):
+        config["port"] = int(os.environ["UWB_PORT"])
+
+    def parse_rate(item):
+        target, _, rate = item.partition("@")
+        return target, (float(rate) if rate else None)
+
+    if os.environ.get("UWB_SUBSCRIBERS"):
+        subscribers = []
+        for item in os.environ["UWB_SUBSCRIBERS"].split(","):
+            target, rate_hz = parse_rate(item.strip())
+            host, _, port = target.partition(":")
+            entry = {"host": host, "rate_hz": rate_hz}
+            if port:
+                entry["port"] = int(port)
+            subscribers.append(entry)
+        config["subscribers"] = subscribers
+    if os.environ.get("UWB_UNIX_PATHS"):
+        config["unix_paths"] = [
+            {"path": path, "rate_hz": rate_hz}
+            for path, rate_hz in (parse_rate(item.strip())
+                                  for item in os.environ["UWB_UNIX_PATHS"].split(","))
+        ]
+    return config
@@ -6,6 +6,7 @@ from collections import deque
 import numpy as np
 import serial.tools.list_ports
 from filterpy.kalman import KalmanFilter
+from shm_channel import DistanceChannelWriter
 
 # -- Configuration --
 # UWB Settings
@@ -63,6 +64,10 @@ if __name__ == "__main__":
     kalman_filters = {}
     last_time = {}
 
+    # Latest filtered distance and velocity per responder, shared with
+    # plot_3D_room.py through shared memory
+    channel = DistanceChannelWriter()
+
     try:
         with serial.Serial(PORT, BAUD_RATE, timeout=1) as ser:
             print(f"Successfully connected to {PORT} at {BAUD_RATE} baud.")
@@ -77,6 +82,7 @@ if __name__ == "__main__":
                     data = json.loads(line)
                     results = data.get("results", [])
                     display_lines = []
+                    updates = {}
 
                     for result in results:
                         addr = result.get("Addr")
@@ -115,13 +121,14 @@ if __name__ == "__main__":
                         kf.update(np.array([[dist]]))
 
                         filtered_dist = kf.x[0, 0]
-                        with open("latest_distance.txt", "w") as f:
-                            f.write(str(filtered_dist))
-
                         velocity = kf.x[1, 0] # in cm/s
+                        updates[addr] = (filtered_dist, velocity, current_time)
                         
                         display_lines.append(f"[{addr}] Dist: {filtered_dist:.1f} cm (V: {velocity:.1f} cm/s)")
 
+                    if updates:
+                        channel.publish(updates)
+
                     if display_lines:
                         sys.stdout.write("\r" + " | ".join(display_lines) + " " * 10)
                         sys.stdout.flush()
@@ -138,4 +145,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\n\nProgram stopped by user.")
     finally:
+        channel.close()
         sys.exit(0)
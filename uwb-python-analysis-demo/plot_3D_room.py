@@ -1,8 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection, Line3DCollection
 import time
 import os
+from shm_channel import DistanceChannelReader
 
 # Room dimensions
 room_width = 6980
@@ -11,15 +12,64 @@ room_height = 3200
 initiator = np.array([0, 0, 0])
 direction = np.array([1, 1, 1]) / np.linalg.norm([1, 1, 1])
 
+FALLBACK_DISTANCE_MM = 4000
+REATTACH_AFTER = 2.0   # seconds without new data before looking for a restarted writer
+channel = None
+next_probe = 0.0
+
 def get_distance():
-    try:
-        with open("latest_distance.txt", "r") as f:
-            return float(f.read().strip()) * 10  # cm to mm
-    except:
-        return 4000  # fallback
+    """
+    Latest filtered distance in mm of the most recently updated responder,
+    read from the shared memory channel of kalman_reader.py
+    """
+    global channel, next_probe
+    if channel is None:
+        try:
+            channel = DistanceChannelReader()
+        except FileNotFoundError:
+            return FALLBACK_DISTANCE_MM  # kalman_reader.py not running yet
+    seq, anchors = channel.read()
+    if not anchors:
+        return FALLBACK_DISTANCE_MM
+    distance_cm, velocity, timestamp = max(anchors.values(), key=lambda a: a[2])
+    if time.time() - timestamp > REATTACH_AFTER and time.monotonic() >= next_probe:
+        # A restarted kalman_reader.py creates a new block under the same name,
+        # with a different sequence counter. Look at most every REATTACH_AFTER
+        # seconds, and only switch when the block there is a new one.
+        next_probe = time.monotonic() + REATTACH_AFTER
+        try:
+            fresh = DistanceChannelReader()
+        except FileNotFoundError:
+            fresh = None
+        if fresh is not None and fresh.read()[0] != seq:
+            channel.close()
+            channel = fresh
+        elif fresh is not None:
+            fresh.close()
+    return distance_cm * 10  # cm to mm
+
+# Unit sphere mesh, computed once. The wireframe is the 30 meridians and 15
+# parallels of this grid; only its scale changes with the distance.
+u, v = np.mgrid[0:2*np.pi:30j, 0:np.pi:15j]
+unit_sphere = np.stack([np.cos(u) * np.sin(v), np.sin(u) * np.sin(v), np.cos(v)], axis=-1)
+unit_meridians = unit_sphere                      # 30 lines of 15 points
+unit_parallels = unit_sphere.transpose(1, 0, 2)   # 15 lines of 30 points
+
+REFRESH_INTERVAL = 0.05   # seconds; faster than the ~10 Hz sensor rate
+
+def sphere_segments(dist_mm):
+    return [*(initiator + unit_meridians * dist_mm), *(initiator + unit_parallels * dist_mm)]
 
-def draw_scene(ax, dist_mm):
-    ax.clear()
+def build_scene(ax, dist_mm):
+    """
+    Create all artists once: the static room box, initiator, labels and
+    limits, plus the responder and sphere that update_scene() changes.
+    The two changing artists are animated, so full draws leave them out
+    and they are blitted over a cached background instead. Depth sorting
+    is off so a full draw layers the artists in creation order, which is
+    the order the blit paints them in too.
+    """
+    ax.computed_zorder = False
 
     # Room box
     room = [
@@ -37,16 +87,14 @@ def draw_scene(ax, dist_mm):
     # Initiator
     ax.scatter(*initiator, color='blue', s=50, label="Initiator")
 
+    # Sphere
+    sphere_artist = Line3DCollection(sphere_segments(dist_mm), colors='red', alpha=0.3, animated=True)
+    ax.add_collection3d(sphere_artist)
+
     # Responder position (example on sphere)
     responder = initiator + direction * dist_mm
-    ax.scatter(*responder, color='red', s=50, label="Responder (on sphere)")
-
-    # Sphere
-    u, v = np.mgrid[0:2*np.pi:30j, 0:np.pi:15j]
-    x = dist_mm * np.cos(u) * np.sin(v)
-    y = dist_mm * np.sin(u) * np.sin(v)
-    z = dist_mm * np.cos(v)
-    ax.plot_wireframe(x, y, z, color='red', alpha=0.3)
+    responder_artist = ax.scatter(*responder, color='red', s=50, label="Responder (on sphere)",
+                                  animated=True)
 
     # Labels and limits
     ax.set_xlim(0, room_width)
@@ -57,16 +105,47 @@ def draw_scene(ax, dist_mm):
     ax.set_zlabel("Z (mm)")
     ax.set_title("Live UWB Responder Sphere")
     ax.legend()
+    return responder_artist, sphere_artist
+
+def update_scene(responder_artist, sphere_artist, dist_mm):
+    responder = initiator + direction * dist_mm
+    responder_artist._offsets3d = ([responder[0]], [responder[1]], [responder[2]])
+    sphere_artist.set_segments(sphere_segments(dist_mm))
 
 # ---------- Live loop ----------
 fig = plt.figure()
 ax = fig.add_subplot(111, projection='3d')
+background = None
+
+def draw_animated():
+    # Axes3D.draw() only projects the artists it draws itself; animated ones
+    # must be projected to 2D here or they keep their old (or no) geometry
+    sphere_artist.do_3d_projection()
+    responder_artist.do_3d_projection()
+    ax.draw_artist(sphere_artist)
+    ax.draw_artist(responder_artist)
+
+def on_draw(event):
+    # Full redraws (first show, rotating, resizing) refresh the cached background
+    global background
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    draw_animated()
 
 try:
-    while True:
-        dist = get_distance()
-        draw_scene(ax, dist)
-        plt.pause(1.0)  # refresh every second
+    dist = get_distance()
+    responder_artist, sphere_artist = build_scene(ax, dist)
+    fig.canvas.mpl_connect("draw_event", on_draw)
+    plt.show(block=False)
+    plt.pause(0.1)
+    while plt.fignum_exists(fig.number):
+        new_dist = get_distance()
+        if new_dist != dist and background is not None:
+            dist = new_dist
+            update_scene(responder_artist, sphere_artist, dist)
+            fig.canvas.restore_region(background)
+            draw_animated()
+            fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+        time.sleep(REFRESH_INTERVAL)
 except KeyboardInterrupt:
     print("Stopped.")
-
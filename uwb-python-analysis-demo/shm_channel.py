@@ -0,0 +1,105 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Shared memory layout
+CHANNEL_NAME = "uwb_latest_distances"
+MAX_ANCHORS = 16
+HEADER = struct.Struct("<QI4x")      # sequence counter, number of anchors
+SLOT = struct.Struct("<16sddd")      # address, distance, velocity, timestamp
+CHANNEL_SIZE = HEADER.size + MAX_ANCHORS * SLOT.size
+READ_RETRIES = 100
+
+
+class DistanceChannelWriter:
+    """
+    Publishes the latest filtered distance, velocity and timestamp per
+    anchor in a shared memory block, protected by a sequence lock.
+
+    The writer makes the counter odd, writes the slots and makes it even
+    again, so a reader that sees the same even counter before and after its
+    copy knows the copy is not torn. There is a single writer; readers
+    never block it.
+    """
+    def __init__(self, name=CHANNEL_NAME):
+        try:
+            # Left over from a writer that crashed
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=CHANNEL_SIZE)
+        self.buf = self.shm.buf
+        # Even and different on every start, so readers notice a restart
+        self.seq = int(time.time() * 1000) * 2
+        self.slots = {}     # anchor address -> slot index
+        HEADER.pack_into(self.buf, 0, self.seq, 0)
+
+    def publish(self, updates):
+        """
+        updates: {anchor address: (distance, velocity, timestamp)}
+        """
+        self.seq += 1
+        HEADER.pack_into(self.buf, 0, self.seq, len(self.slots))
+        for addr, (distance, velocity, timestamp) in updates.items():
+            slot = self.slots.get(addr)
+            if slot is None:
+                if len(self.slots) == MAX_ANCHORS:
+                    continue
+                slot = self.slots[addr] = len(self.slots)
+            SLOT.pack_into(self.buf, HEADER.size + slot * SLOT.size,
+                           addr.encode()[:16], distance, velocity, timestamp)
+        self.seq += 1
+        HEADER.pack_into(self.buf, 0, self.seq, len(self.slots))
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class DistanceChannelReader:
+    """
+    Reads consistent snapshots of a DistanceChannelWriter block.
+    Raises FileNotFoundError if no writer has created the channel yet.
+    """
+    def __init__(self, name=CHANNEL_NAME):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 every attach is tracked and the block would be
+            # unlinked when this reader exits, under the writer's feet
+            from multiprocessing import resource_tracker
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.buf = self.shm.buf
+        self.last_seq = 0
+        self.last = {}
+
+    def read(self):
+        """
+        Returns (sequence, {anchor address: (distance, velocity, timestamp)}).
+        The sequence only changes when the writer published something new. If
+        the writer keeps interrupting, the previous snapshot is returned.
+        """
+        for _ in range(READ_RETRIES):
+            seq, count = HEADER.unpack_from(self.buf, 0)
+            if seq == self.last_seq:
+                return seq, self.last
+            if seq % 2:
+                time.sleep(0)
+                continue
+            data = bytes(self.buf[HEADER.size:HEADER.size + count * SLOT.size])
+            if HEADER.unpack_from(self.buf, 0)[0] != seq:
+                continue
+            snapshot = {}
+            for addr, distance, velocity, timestamp in SLOT.iter_unpack(data):
+                snapshot[addr.rstrip(b"\0").decode()] = (distance, velocity, timestamp)
+            self.last_seq, self.last = seq, snapshot
+            return seq, snapshot
+        return self.last_seq, self.last
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,604 @@
+"""
+Anchor self-calibration
+
+Record a session while walking the tag around the room:
+    python calibrate_anchors.py record session.jsonl
+
+Solve for anchor positions and per-anchor range bias and write them into
+room_config.json:
+    python calibrate_anchors.py solve session.jsonl [more.jsonl ...]
+    python calibrate_anchors.py solve --anchor-ranges anchor_ranges.json
+    python calibrate_anchors.py solve session.jsonl --bias-tables
+
+anchor_ranges.json holds measured anchor-to-anchor ranges in mm:
+    [{"a": "0x0001", "b": "0x0002", "distance_mm": 4970}, ...]
+
+All epochs are solved together as one robust least-squares problem (anchor
+positions, anchor delays, the tag antenna delay and one tag position per
+epoch). Long recordings are binned to at most --max-epochs epochs first, so
+hours of data solve in seconds. The config is only written when the solver
+converged. Range data cannot place the anchor layout in the room, so its
+position and tilt follow the current anchor positions on average; what the
+calibration corrects is the layout itself and the range bias. With --bias-tables the remaining distance-dependent error
+of every anchor is fitted into a piecewise-linear "bias_table" as well;
+otherwise existing tables are applied to the data before solving.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+import numpy as np
+
+from range_correction import RangeCorrector, fit_bias_table
+from room_geometry import DEFAULT_CONFIG_PATH, RoomGeometry, load_room_config
+
+# Solver settings
+MAX_EPOCHS = 3000         # recordings are binned down to this many epochs
+RANGE_SIGMA = 50.0        # mm, expected UWB range noise after binning
+PRIOR_SIGMA = 200.0       # mm, how far hand-measured anchor positions may be off
+BIAS_SIGMA = 300.0        # mm, weak prior keeping biases near zero
+ROBUST_SCALE = 150.0      # mm, soft_l1 loss scale to down-weight NLOS ranges
+MAX_ITERATIONS = 500      # Levenberg-Marquardt iterations in total
+MIRROR_CHECK_EVERY = 10   # iterations between checks for tags on the wrong side of the anchors
+STEP_TOLERANCE = 0.01     # mm; converged once no anchor parameter moves more than this
+COST_TOLERANCE = 1e-8     # relative cost decrease counted as stalled
+GRADIENT_TOLERANCE = 1e-3 # mm-scaled gradient that counts as stationary
+MIRROR_MARGIN = 3.0       # range sigmas by which the ranges must favour one side of the anchor plane
+MIRROR_MIN_OFFSET = 500.0 # mm from the anchor plane below which the ranges alone pick the side
+ROOM_MARGIN = 200.0       # mm a tag position may lie outside the room and still count as inside
+
+
+def record_session(path, port=5005):
+    """
+    Append every received UDP packet to path as one JSON line
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+    count = 0
+    print(f"Recording UDP {port} to {path} - press Ctrl+C to stop")
+    with open(path, "a") as f:
+        try:
+            while True:
+                data, _ = sock.recvfrom(1024)
+                try:
+                    raw_data = json.loads(data.decode())
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                raw_data["received"] = time.time()
+                f.write(json.dumps(raw_data) + "\n")
+                count += 1
+                if count % 100 == 0:
+                    sys.stdout.write(f"\r{count} packets")
+                    sys.stdout.flush()
+        except KeyboardInterrupt:
+            print(f"\nRecorded {count} packets")
+
+
+def load_sessions(paths, anchor_ids):
+    """
+    Ranges of all recorded packets as an (epochs x anchors) array in mm,
+    NaN where an anchor was not in the packet
+    """
+    index = {addr: i for i, addr in enumerate(anchor_ids)}
+    rows = []
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    distances = json.loads(line).get("distances", {})
+                except json.JSONDecodeError:
+                    continue
+                row = [np.nan] * len(anchor_ids)
+                for addr, distance in distances.items():
+                    if addr in index:
+                        row[index[addr]] = distance
+                rows.append(row)
+    return np.array(rows, dtype=float).reshape(-1, len(anchor_ids))
+
+
+def bin_epochs(ranges, max_epochs):
+    """
+    Median of consecutive epochs so at most max_epochs remain. The tag moves
+    little within a bin at walking speed, and the median rejects outliers.
+    """
+    size = int(np.ceil(len(ranges) / max_epochs)) if len(ranges) > max_epochs else 1
+    if size == 1:
+        return ranges
+    usable = (len(ranges) // size) * size
+    blocks = ranges[:usable].reshape(-1, size, ranges.shape[1])
+    with np.errstate(all="ignore"):
+        all_nan = np.all(np.isnan(blocks), axis=1)
+        blocks = np.where(np.isnan(blocks), np.inf, blocks)
+        binned = np.sort(blocks, axis=1)
+        counts = np.sum(np.isfinite(blocks), axis=1)
+        middle = np.take_along_axis(binned, np.maximum(counts - 1, 0)[:, None, :] // 2, axis=1)[:, 0, :]
+    middle[all_nan] = np.nan
+    return middle
+
+
+def initial_tag_positions(geometry, ranges):
+    """
+    Closed-form trilateration for every epoch, vectorised. The z mirror
+    ambiguity is resolved towards the inside of the room.
+    """
+    room = geometry.room
+    center = np.array([room["width_x"], room["depth_y"], room["height_z"]]) / 2.0
+    positions = np.tile(center, (len(ranges), 1))
+    ok = np.all(np.isfinite(ranges[:, :3]), axis=1)
+    if not np.any(ok):
+        return positions
+
+    b = geometry.basis_3d
+    r1, r2, r3 = ranges[ok, 0], ranges[ok, 1], ranges[ok, 2]
+    x = (r1**2 - r2**2 + b["d"]**2) / (2 * b["d"])
+    y = (r1**2 - r3**2 + b["i"]**2 + b["j"]**2 - 2 * b["i"] * x) / (2 * b["j"])
+    z = np.sqrt(np.abs(r1**2 - x**2 - y**2))
+    base = b["origin"] + x[:, None] * b["ex"] + y[:, None] * b["ey"]
+    up = base + z[:, None] * b["ez"]
+    down = base - z[:, None] * b["ez"]
+    up_inside = (up[:, 2] >= 0) & (up[:, 2] <= room["height_z"])
+    estimate = np.where(up_inside[:, None], up, down)
+
+    upper = np.array([room["width_x"], room["depth_y"], room["height_z"]])
+    positions[ok] = np.clip(estimate, 0, upper)
+    return positions
+
+
+class CalibrationProblem:
+    """
+    Joint robust least-squares problem over anchor positions, anchor range
+    delays, one tag antenna delay and one tag position per epoch.
+
+    Tag ranges are modelled as |tag - anchor| + delay[anchor] + tag_delay,
+    anchor-to-anchor ranges as |a - b| + delay[a] + delay[b]. The config's
+    range_bias_mm is what a tag range sees, delay + tag_delay; with tag
+    ranges alone only that sum is observable and the tag delay stays at 0.
+
+    solve() runs Levenberg-Marquardt with the tag positions eliminated
+    through the Schur complement, as in bundle adjustment: every epoch only
+    couples its own 3x3 block to the anchor parameters, so each step solves
+    one small dense system exactly. The soft_l1 loss is applied through
+    iteratively reweighted normal equations. Epochs whose tag position is
+    mirrored across the anchor plane are a local minimum the step cannot
+    leave, so each round checks the reflected position of every epoch and
+    flips those that fit better.
+    """
+    def __init__(self, ranges, prior_positions, prior_bias, pair_ranges=(),
+                 range_sigma=RANGE_SIGMA, prior_sigma=PRIOR_SIGMA, bias_sigma=BIAS_SIGMA,
+                 room=None):
+        self.n_anchors = len(prior_positions)
+        self.n_epochs = len(ranges)
+        self.prior_positions = np.asarray(prior_positions, dtype=float)
+        self.prior_bias = np.asarray(prior_bias, dtype=float)
+        self.room = room
+
+        # Dense (epochs x anchors) layout; missing ranges get zero weight
+        self.ranges = np.nan_to_num(ranges, nan=0.0)
+        self.mask = np.isfinite(ranges)
+        epoch, anchor = np.nonzero(self.mask)
+        self.obs_epoch = epoch
+        self.obs_anchor = anchor
+        self.obs_range = ranges[epoch, anchor]
+
+        self.pairs = np.array([(a, b) for a, b, _ in pair_ranges], dtype=int).reshape(-1, 2)
+        self.pair_range = np.array([d for _, _, d in pair_ranges], dtype=float)
+
+        self.range_sigma = range_sigma
+        self.w_prior = range_sigma / prior_sigma
+        self.w_bias = range_sigma / bias_sigma
+
+        # Anchor-side parameter vector: positions (3N), delays (N), tag delay
+        n = self.n_anchors
+        self.n_params = 4 * n + 1
+        self.anchor_columns = np.array([[3 * i, 3 * i + 1, 3 * i + 2, 3 * n + i, 4 * n]
+                                        for i in range(n)])
+
+    # Residuals
+
+    def range_residuals(self, anchors, bias, tags):
+        """
+        Tag range residuals for observed ranges; bias is the total per-anchor
+        bias seen by the tag (delay + tag delay)
+        """
+        delta = tags[self.obs_epoch] - anchors[self.obs_anchor]
+        dist = np.linalg.norm(delta, axis=1)
+        return dist + bias[self.obs_anchor] - self.obs_range, delta, dist
+
+    def _dense_residuals(self, anchors, bias, tags):
+        delta = tags[:, None, :] - anchors[None, :, :]
+        dist = np.maximum(np.linalg.norm(delta, axis=2), 1e-9)
+        residual = np.where(self.mask, dist + bias[None, :] - self.ranges, 0.0)
+        return residual, delta / dist[:, :, None]
+
+    @staticmethod
+    def robust(residual):
+        """
+        soft_l1 loss and its IRLS weight
+        """
+        z = (residual / ROBUST_SCALE)**2
+        return 2.0 * ROBUST_SCALE**2 * (np.sqrt(1.0 + z) - 1.0), 1.0 / np.sqrt(1.0 + z)
+
+    def _unpack(self, q):
+        n = self.n_anchors
+        return q[:3 * n].reshape(n, 3), q[3 * n:4 * n], q[4 * n]
+
+    def _anchor_terms(self, q):
+        """
+        Pair and prior residuals with their Jacobian rows (dense, small)
+        """
+        anchors, delay, tag_delay = self._unpack(q)
+        n = self.n_anchors
+        residuals, rows, robust = [], [], []
+        if len(self.pairs):
+            a, b = self.pairs[:, 0], self.pairs[:, 1]
+            diff = anchors[a] - anchors[b]
+            length = np.maximum(np.linalg.norm(diff, axis=1), 1e-9)
+            unit = diff / length[:, None]
+            J = np.zeros((len(a), self.n_params))
+            for k in range(len(a)):
+                J[k, 3 * a[k]:3 * a[k] + 3] = unit[k]
+                J[k, 3 * b[k]:3 * b[k] + 3] = -unit[k]
+                J[k, 3 * n + a[k]] += 1.0
+                J[k, 3 * n + b[k]] += 1.0
+            residuals.append(length + delay[a] + delay[b] - self.pair_range)
+            rows.append(J)
+            robust.append(np.ones(len(a), dtype=bool))
+        J = np.zeros((3 * n, self.n_params))
+        J[:, :3 * n] = self.w_prior * np.eye(3 * n)
+        residuals.append(self.w_prior * (anchors - self.prior_positions).ravel())
+        rows.append(J)
+        J = np.zeros((n + 1, self.n_params))
+        J[:n, 3 * n:4 * n] = self.w_bias * np.eye(n)
+        J[:n, 4 * n] = self.w_bias
+        J[n, 4 * n] = self.w_bias
+        residuals.append(self.w_bias * np.append(delay + tag_delay - self.prior_bias, tag_delay))
+        rows.append(J)
+        robust += [np.zeros(3 * n, dtype=bool), np.zeros(n + 1, dtype=bool)]
+        return np.concatenate(residuals), np.vstack(rows), np.concatenate(robust)
+
+    def epoch_costs(self, anchors, bias, tags):
+        residual, _ = self._dense_residuals(anchors, bias, tags)
+        loss, _ = self.robust(residual)
+        return np.sum(np.where(self.mask, loss, 0.0), axis=1)
+
+    def cost(self, q, tags):
+        anchors, delay, tag_delay = self._unpack(q)
+        total = np.sum(self.epoch_costs(anchors, delay + tag_delay, tags))
+        residual, _, robust = self._anchor_terms(q)
+        loss, _ = self.robust(residual)
+        return total + np.sum(np.where(robust, loss, residual**2))
+
+    # Tag positions with fixed anchors
+
+    def solve_tags_only(self, anchors, bias, tags0, iterations=50):
+        """
+        Per-epoch robust Gauss-Newton for the tag positions, vectorised over
+        all epochs with an individual damping factor per epoch
+        """
+        tags = np.array(tags0, dtype=float)
+        if self.n_epochs == 0:
+            return tags
+        lam = np.full(self.n_epochs, 1e-3)
+        cost = self.epoch_costs(anchors, bias, tags)
+        for _ in range(iterations):
+            residual, unit = self._dense_residuals(anchors, bias, tags)
+            _, weight = self.robust(residual)
+            weight = np.where(self.mask, weight, 0.0)
+            H = np.einsum("en,eni,enj->eij", weight, unit, unit)
+            g = np.einsum("en,eni,en->ei", weight, unit, residual)
+            H_damped = H + (lam[:, None] * np.diagonal(H, axis1=1, axis2=2) + 1e-9)[:, :, None] * np.eye(3)
+            step = -np.linalg.solve(H_damped, g[:, :, None])[:, :, 0]
+            candidate = tags + step
+            new_cost = self.epoch_costs(anchors, bias, candidate)
+            better = new_cost < cost
+            tags[better] = candidate[better]
+            cost[better] = new_cost[better]
+            lam = np.where(better, lam / 3.0, lam * 5.0)
+            if np.max(np.abs(step[better]), initial=0.0) < STEP_TOLERANCE and np.all(better | (lam > 1e6)):
+                break
+        return tags
+
+    def best_of_mirrors(self, anchors, bias, tags):
+        """
+        Put every tag position on the right side of the anchors' best-fit
+        plane. With anchors mounted at similar heights both sides fit the
+        ranges almost equally, so a side is only decided by the ranges when
+        it fits clearly better, then by the room (a side outside it is
+        dropped), and otherwise by the side most decided epochs are on.
+        Positions near the plane are left where the ranges put them.
+        Returns (tags, number of epochs flipped).
+        """
+        center = anchors.mean(axis=0)
+        normal = np.linalg.svd(anchors - center)[2][-1]
+        reflected = tags - 2.0 * ((tags - center) @ normal)[:, None] * normal
+        reflected = self.solve_tags_only(anchors, bias, reflected)
+        current_cost = self.epoch_costs(anchors, bias, tags)
+        reflected_cost = self.epoch_costs(anchors, bias, reflected)
+        offset = (tags - center) @ normal
+        side = np.sign(offset)
+        # Refinement can slide a reflection back across the plane
+        crossed = np.sign((reflected - center) @ normal) == -side
+        margin = (MIRROR_MARGIN * self.range_sigma)**2
+        prefer_reflected = crossed & (reflected_cost < current_cost - margin)
+        prefer_current = ~crossed | (current_cost < reflected_cost - margin)
+        if self.room is not None:
+            upper = np.array([self.room["width_x"], self.room["depth_y"], self.room["height_z"]])
+
+            def inside(positions):
+                return np.all((positions > -ROOM_MARGIN) & (positions < upper + ROOM_MARGIN), axis=1)
+            current_inside, reflected_inside = inside(tags), inside(reflected)
+            prefer_reflected = reflected_inside & (prefer_reflected | ~current_inside)
+            prefer_current = current_inside & (prefer_current | ~reflected_inside)
+
+        # Undecided epochs go to the side the decided ones are mostly on,
+        # unless they are so close to the plane that the ranges should decide
+        decided_side = np.concatenate([side[prefer_current], -side[prefer_reflected]])
+        majority = np.sign(np.sum(decided_side))
+        undecided = ~prefer_current & ~prefer_reflected & (np.abs(offset) > MIRROR_MIN_OFFSET)
+        flipped = prefer_reflected | (undecided & (majority != 0) & (side == -majority))
+        tags = tags.copy()
+        tags[flipped] = reflected[flipped]
+        return tags, int(np.sum(flipped))
+
+    # Joint solve
+
+    def _normal_equations(self, q, tags):
+        anchors, delay, tag_delay = self._unpack(q)
+        residual, unit = self._dense_residuals(anchors, delay + tag_delay, tags)
+        _, weight = self.robust(residual)
+        weight = np.where(self.mask, weight, 0.0)
+        E, n = residual.shape
+
+        # Tag blocks and their coupling to the anchor parameters. Per range the
+        # anchor-side Jacobian is [-unit, 1 (delay), 1 (tag delay)].
+        H_tt = np.einsum("en,eni,enj->eij", weight, unit, unit)
+        g_t = np.einsum("en,eni,en->ei", weight, unit, residual)
+        V = np.concatenate([-unit, np.ones((E, n, 2))], axis=2)
+        H_tq = np.zeros((E, 3, self.n_params))
+        H_qq = np.zeros((self.n_params, self.n_params))
+        g_q = np.zeros(self.n_params)
+        for i in range(n):
+            cols = self.anchor_columns[i]
+            w = weight[:, i]
+            np.add.at(H_tq, (slice(None), slice(None), cols),
+                      np.einsum("e,ei,ej->eij", w, unit[:, i], V[:, i]))
+            H_qq[np.ix_(cols, cols)] += np.einsum("e,ei,ej->ij", w, V[:, i], V[:, i])
+            np.add.at(g_q, cols, np.einsum("e,ei,e->i", w, V[:, i], residual[:, i]))
+
+        r_a, J_a, robust = self._anchor_terms(q)
+        _, w_a = self.robust(r_a)
+        w_a = np.where(robust, w_a, 1.0)
+        H_qq += J_a.T @ (w_a[:, None] * J_a)
+        g_q += J_a.T @ (w_a * r_a)
+        return H_tt, g_t, H_tq, H_qq, g_q
+
+    def solve(self, tags0, max_iterations=MAX_ITERATIONS):
+        """
+        Returns (anchors, bias, tags, report). bias is the total per-anchor
+        bias seen by tag ranges; report holds "converged", "iterations",
+        "gradient", "flipped" and "tag_delay".
+
+        Levenberg-Marquardt runs in rounds of MIRROR_CHECK_EVERY iterations;
+        after each round the tag positions are moved back to the right side
+        of the anchor plane, until a round converges with nothing to flip.
+        """
+        q = np.concatenate([self.prior_positions.ravel(), self.prior_bias, [0.0]])
+        tags = np.asarray(tags0, dtype=float)
+        report = {"converged": False, "iterations": 0, "gradient": np.inf, "flipped": 0}
+        while report["iterations"] < max_iterations:
+            anchors, delay, tag_delay = self._unpack(q)
+            tags, flipped = self.best_of_mirrors(anchors, delay + tag_delay, tags)
+            report["flipped"] += flipped
+            if report["converged"] and flipped == 0:
+                break
+            iterations = min(MIRROR_CHECK_EVERY, max_iterations - report["iterations"])
+            q, tags, converged, used, gradient = self._levenberg_marquardt(q, tags, iterations)
+            report["iterations"] += used
+            report["converged"], report["gradient"] = converged, gradient
+        else:
+            report["converged"] = False
+        anchors, delay, tag_delay = self._unpack(q)
+        report["tag_delay"] = float(tag_delay)
+        return anchors.copy(), delay + tag_delay, tags, report
+
+    def _levenberg_marquardt(self, q, tags, max_iterations):
+        lam = 1e-4
+        cost = self.cost(q, tags)
+        gradient = np.inf
+        for iteration in range(1, max_iterations + 1):
+            H_tt, g_t, H_tq, H_qq, g_q = self._normal_equations(q, tags)
+            # Gradient of the anchor parameters with the tags at their optimum
+            # for the current anchors (reduced problem), scaled to mm
+            H_tt_reg = H_tt + 1e-9 * np.eye(3)
+            reduced = g_q - np.einsum("eia,ei->a", H_tq, np.linalg.solve(H_tt_reg, g_t[:, :, None])[:, :, 0])
+            gradient = float(np.max(np.abs(reduced) / np.sqrt(np.maximum(np.diag(H_qq), 1e-12))))
+            while True:
+                H_tt_damped = H_tt + (lam * np.diagonal(H_tt, axis1=1, axis2=2) + 1e-9)[:, :, None] * np.eye(3)
+                H_tt_inv = np.linalg.inv(H_tt_damped)
+                coupling = np.einsum("eij,ejb->eib", H_tt_inv, H_tq)
+                schur = (H_qq + lam * np.diag(np.diag(H_qq)) -
+                         np.einsum("eia,eib->ab", H_tq, coupling))
+                rhs = g_q - np.einsum("eia,ei->a", H_tq, np.einsum("eij,ej->ei", H_tt_inv, g_t))
+                dq = -np.linalg.solve(schur, rhs)
+                dt = -np.einsum("eij,ej->ei", H_tt_inv, g_t + np.einsum("eia,a->ei", H_tq, dq))
+                new_cost = self.cost(q + dq, tags + dt)
+                if new_cost < cost:
+                    q, tags = q + dq, tags + dt
+                    decrease = (cost - new_cost) / cost
+                    cost = new_cost
+                    lam = max(lam / 3.0, 1e-12)
+                    break
+                lam *= 5.0
+                if lam > 1e10:
+                    # No downhill step left: converged if the gradient is zero
+                    return q, tags, gradient < GRADIENT_TOLERANCE, iteration, gradient
+            # Only the anchor side is written out; single tags near the anchor
+            # plane can keep creeping along flat valleys without changing it
+            if gradient < GRADIENT_TOLERANCE or (np.max(np.abs(dq)) < STEP_TOLERANCE
+                                                 and decrease < COST_TOLERANCE):
+                return q, tags, True, iteration, gradient
+        return q, tags, False, max_iterations, gradient
+
+
+def rms(values):
+    return float(np.sqrt(np.mean(values**2))) if len(values) else float("nan")
+
+
+def load_anchor_ranges(path, index):
+    with open(path, "r") as f:
+        entries = json.load(f)
+    pairs = []
+    for entry in entries:
+        if entry["a"] in index and entry["b"] in index:
+            pairs.append((index[entry["a"]], index[entry["b"]], float(entry["distance_mm"])))
+    return pairs
+
+
+def fit_bias_tables(problem, anchors, bias, tags, anchor_ids):
+    """
+    Distance-dependent range error left after the constant bias, per anchor
+    """
+    errors, delta, dist = problem.range_residuals(anchors, bias, tags)
+    tables = {}
+    for i, addr in enumerate(anchor_ids):
+        mask = problem.obs_anchor == i
+        tables[addr] = fit_bias_table(dist[mask], errors[mask])
+    return tables
+
+
+def write_config(path, config, geometry, anchors, bias, tables=None):
+    """
+    Write calibrated anchors into the config. The file is replaced atomically
+    so a running visualizer never reads a half-written file.
+    """
+    for i, addr in enumerate(geometry.anchor_ids):
+        entry = config["anchors"][addr]
+        entry["position"] = [round(float(v), 1) for v in anchors[i]]
+        entry["range_bias_mm"] = round(float(bias[i]), 1)
+        if tables is not None:
+            entry.pop("bias_poly", None)
+            entry.pop("bias_table", None)
+            if tables.get(addr):
+                entry["bias_table"] = tables[addr]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=4)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def calibrate(args):
+    started = time.time()
+    config = load_room_config(args.config)
+    geometry = RoomGeometry(config)
+    ids = geometry.anchor_ids
+    prior_bias = np.array([geometry.range_bias[addr] for addr in ids])
+
+    ranges = load_sessions(args.sessions, ids) if args.sessions else np.empty((0, len(ids)))
+    raw_epochs = len(ranges)
+    if not args.bias_tables:
+        # Keep the existing distance-dependent tables; only the constant bias is re-solved
+        tables_only = RangeCorrector(config["anchors"], ids, geometry.room_diagonal,
+                                     include_bias=False)
+        ranges = tables_only.correct_matrix(ranges)
+    ranges = ranges[np.sum(np.isfinite(ranges), axis=1) >= 3]
+    ranges = bin_epochs(ranges, args.max_epochs)
+    pairs = load_anchor_ranges(args.anchor_ranges, geometry.index) if args.anchor_ranges else []
+    if len(ranges) == 0 and not pairs:
+        sys.exit("No usable data: need a recorded session or anchor-to-anchor ranges")
+    print(f"Loaded {raw_epochs} packets -> {len(ranges)} epochs, {len(pairs)} anchor pair ranges")
+
+    problem = CalibrationProblem(ranges, geometry.positions, prior_bias, pairs,
+                                 prior_sigma=args.prior_sigma, room=geometry.room)
+
+    # Baseline: best tag track the current configuration can explain
+    tags0 = initial_tag_positions(geometry, ranges - prior_bias)
+    tags_before = problem.solve_tags_only(geometry.positions, prior_bias, tags0)
+    tags_before, _ = problem.best_of_mirrors(geometry.positions, prior_bias, tags_before)
+    before, _, _ = problem.range_residuals(geometry.positions, prior_bias, tags_before)
+
+    anchors, bias, tags, report = problem.solve(tags_before, args.max_iterations)
+    after, _, dist = problem.range_residuals(anchors, bias, tags)
+    delay = bias - report["tag_delay"]
+
+    tables = None
+    if args.bias_tables and len(ranges):
+        tables = fit_bias_tables(problem, anchors, bias, tags, ids)
+        # Residual once the fitted tables are applied on top of the constant bias
+        table_error = np.zeros_like(after)
+        for i, addr in enumerate(ids):
+            if tables[addr]:
+                mask = problem.obs_anchor == i
+                table_error[mask] = np.interp(dist[mask], tables[addr]["distance_mm"],
+                                              tables[addr]["correction_mm"])
+        after_tables = after - table_error
+
+    print(f"\n{'Anchor':<8} {'old position (mm)':>26} {'new position (mm)':>26} {'moved':>7} {'bias':>7}")
+    for i, addr in enumerate(ids):
+        old = geometry.positions[i]
+        moved = np.linalg.norm(anchors[i] - old)
+        print(f"{addr:<8} {np.array2string(old, precision=0):>26} "
+              f"{np.array2string(anchors[i], precision=0):>26} {moved:7.1f} {bias[i]:7.1f}")
+    if len(pairs):
+        before_pairs = [geometry.pair_distances[a, b] + prior_bias[a] + prior_bias[b] - d
+                        for a, b, d in pairs]
+        after_pairs = [np.linalg.norm(anchors[a] - anchors[b]) + delay[a] + delay[b] - d
+                       for a, b, d in pairs]
+        print(f"\nAnchor pair RMS residual: {rms(np.array(before_pairs)):.1f} mm -> "
+              f"{rms(np.array(after_pairs)):.1f} mm")
+    if len(ranges):
+        print(f"Tag range RMS residual:   {rms(before):.1f} mm -> {rms(after):.1f} mm "
+              f"(median abs {np.median(np.abs(before)):.1f} -> {np.median(np.abs(after)):.1f} mm)")
+    if tables is not None:
+        fitted = [addr for addr in ids if tables[addr]]
+        print(f"Bias tables fitted for {len(fitted)}/{len(ids)} anchors, "
+              f"RMS residual with tables: {rms(after_tables):.1f} mm")
+    if len(pairs) and len(ranges):
+        print(f"Tag antenna delay:        {report['tag_delay']:.1f} mm")
+    print(f"Solved in {time.time() - started:.1f} s, {report['iterations']} iterations, "
+          f"{report['flipped']} mirrored epochs corrected, gradient {report['gradient']:.2g}")
+
+    if not report["converged"]:
+        print("Solver did not converge - config not written")
+        if not args.dry_run:
+            sys.exit(1)
+    elif args.dry_run:
+        print("Dry run - config not written")
+    else:
+        write_config(args.config, config, geometry, anchors, bias, tables)
+        print(f"Wrote calibrated anchors to {args.config}")
+    return geometry, anchors, bias, tags, ranges, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UWB anchor self-calibration")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="record UDP packets to a JSON lines file")
+    rec.add_argument("output")
+    rec.add_argument("--port", type=int, default=5005)
+
+    solve = sub.add_parser("solve", help="solve anchor positions and range bias")
+    solve.add_argument("sessions", nargs="*", help="recorded JSON lines files")
+    solve.add_argument("--anchor-ranges", help="JSON file with anchor-to-anchor ranges")
+    solve.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    solve.add_argument("--max-epochs", type=int, default=MAX_EPOCHS)
+    solve.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS)
+    solve.add_argument("--prior-sigma", type=float, default=PRIOR_SIGMA,
+                       help="mm, trust in the current anchor positions")
+    solve.add_argument("--bias-tables", action="store_true",
+                       help="also fit per-anchor distance-dependent bias tables")
+    solve.add_argument("--dry-run", action="store_true", help="report only, do not write the config")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_session(args.output, args.port)
+    else:
+        calibrate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import math
+import threading
+import numpy as np
+
+# Display smoothing settings
+BLEND_TIME_CONSTANT = 0.15   # seconds for the correction after a new fix to decay to 37%
+MAX_EXTRAPOLATION = 0.5      # seconds; beyond this the prediction holds still
+MAX_SPEED = 3000.0           # mm/s; velocity estimates above this are clamped
+
+
+class DisplaySmoother:
+    """
+    Time-based position smoothing for display and fixed-rate output.
+
+    Between fixes the position is extrapolated along the filter velocity to
+    the requested instant, so the shown position does not lag behind by the
+    packet interval and does not depend on the frame rate. When a new fix
+    arrives, the jump between the old prediction and the new one is not
+    shown at once but decays exponentially with BLEND_TIME_CONSTANT.
+
+    All times are in seconds on one clock (time.monotonic()).
+    """
+    def __init__(self, time_constant=BLEND_TIME_CONSTANT, max_extrapolation=MAX_EXTRAPOLATION):
+        self.time_constant = time_constant
+        self.max_extrapolation = max_extrapolation
+        self.fix_time = None
+        self.fix_position = None
+        self.velocity = None
+        self.offset = None
+        self.lock = threading.Lock()
+
+    def update(self, t, position, velocity=None):
+        """
+        Add a fix measured at time t with optional velocity in mm/s
+        """
+        position = np.asarray(position, dtype=float)
+        if velocity is None:
+            velocity = np.zeros_like(position)
+        velocity = np.asarray(velocity, dtype=float)
+        speed = np.linalg.norm(velocity)
+        if speed > MAX_SPEED:
+            velocity = velocity * (MAX_SPEED / speed)
+
+        with self.lock:
+            if self.fix_time is None or len(position) != len(self.fix_position):
+                offset = np.zeros_like(position)
+            else:
+                # Continue from what is on screen right now
+                offset = self._position(t) - position
+            self.fix_time = t
+            self.fix_position = position
+            self.velocity = velocity
+            self.offset = offset
+
+    def _predict(self, t):
+        dt = min(max(t - self.fix_time, 0.0), self.max_extrapolation)
+        return self.fix_position + self.velocity * dt
+
+    def _position(self, t):
+        decay = math.exp(-max(t - self.fix_time, 0.0) / self.time_constant)
+        return self._predict(t) + self.offset * decay
+
+    def position(self, t):
+        """
+        Smoothed position at time t, or None before the first fix
+        """
+        with self.lock:
+            if self.fix_time is None:
+                return None
+            return self._position(t)
+
+    def predict(self, t):
+        """
+        Unsmoothed prediction at time t (fix extrapolated along the velocity),
+        or None before the first fix
+        """
+        with self.lock:
+            if self.fix_time is None:
+                return None
+            return self._predict(t)
+
+    def age(self, t):
+        """
+        Seconds since the last fix, or None before the first fix
+        """
+        with self.lock:
+            return None if self.fix_time is None else t - self.fix_time
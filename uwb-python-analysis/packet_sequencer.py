@@ -0,0 +1,241 @@
+import time
+
+# Reorder window settings
+REORDER_WINDOW = 8       # packets held while waiting for a gap to fill
+MAX_HOLD_TIME = 0.05     # seconds a gap may delay delivery before it is declared lost
+STATS_INTERVAL = 10.0    # seconds between printed stats
+CLOCK_DRIFT = 1e-4       # s/s the clock offset estimate may creep up, above crystal drift
+
+
+def packet_time(raw_data):
+    """
+    Sender-side time of a packet for filter dt. Uses the sender's monotonic
+    clock when available so wall clock steps (NTP) do not corrupt dt.
+    """
+    if "mono" in raw_data:
+        return raw_data["mono"]
+    return raw_data.get("timestamp", 0.0)
+
+
+class ClockOffset:
+    """
+    Maps each sender's monotonic clock ("mono") onto this receiver's
+    time.monotonic(), so a fix can be placed at the instant it was measured
+    instead of the instant the receive loop got to it.
+
+    arrival - mono is the clock offset plus the packet's delay, so its
+    running minimum over a sender's packets is the offset plus the smallest
+    delay seen. The minimum may creep up by CLOCK_DRIFT per second to
+    follow drift between the two clocks. A sender restart
+    (session_start) starts a new estimate, as its clock is a new timebase.
+    """
+    def __init__(self, drift=CLOCK_DRIFT):
+        self.drift = drift
+        self.sources = {}    # source -> (offset, arrival of the last packet)
+
+    def measured_at(self, raw_data):
+        """
+        Receiver time.monotonic() at which the packet was measured. Needs the
+        arrival time stamped as "arrival" when the packet was received;
+        packets without "mono" (older senders) are placed at their arrival.
+        """
+        arrival = raw_data["arrival"]
+        if "mono" not in raw_data:
+            return arrival
+        source = raw_data.get("source", "tag")
+        sample = arrival - raw_data["mono"]
+        entry = self.sources.get(source)
+        if entry is None or raw_data.get("session_start"):
+            offset = sample
+        else:
+            offset, last_arrival = entry
+            offset = min(offset + self.drift * max(arrival - last_arrival, 0.0), sample)
+        self.sources[source] = (offset, arrival)
+        return raw_data["mono"] + offset
+
+
+class SourceState:
+    """
+    Sequencing state and loss/reorder counters for a single sender. The
+    counters cover all sessions of the sender; start_session() only resets
+    the sequencing state.
+    """
+    def __init__(self, session):
+        self.received = 0
+        self.delivered = 0
+        self.lost = 0
+        self.reordered = 0
+        self.late = 0
+        self.duplicates = 0
+        self.stale = 0             # packets from an older session, dropped
+        self.restarts = 0
+        self.start_session(session)
+
+    def start_session(self, session):
+        self.session = session
+        self.next_seq = None
+        self.max_seen = None
+        self.pending = {}          # seq -> (raw_data, arrival time)
+        self.skipped = set()       # recently declared lost, to recognise late arrivals
+
+    def is_older(self, session):
+        """
+        Sessions are the sender's start time in epoch ms, so they only grow
+        """
+        return session is not None and self.session is not None and session < self.session
+
+    def loss_rate(self):
+        expected = self.delivered + self.lost
+        return self.lost / expected if expected else 0.0
+
+    def reorder_rate(self):
+        return self.reordered / self.received if self.received else 0.0
+
+
+class PacketSequencer:
+    """
+    Restores per-source sequence order of incoming packets.
+
+    Packets are held for at most MAX_HOLD_TIME (or REORDER_WINDOW packets)
+    while a gap is open. When the gap times out the missing sequence numbers
+    are counted as lost and the held packets are released in order. Packets
+    that arrive after their slot has been passed are dropped as late, and
+    packets from a session older than the current one (delayed past a
+    sender restart) are dropped as stale. Packets without a "seq" field
+    (older senders) are passed straight through.
+    """
+    def __init__(self, window=REORDER_WINDOW, max_hold=MAX_HOLD_TIME):
+        self.window = window
+        self.max_hold = max_hold
+        self.sources = {}
+        self.last_stats = time.monotonic()
+
+    def push(self, raw_data, now=None):
+        """
+        Add a received packet. Returns the list of packets that are now
+        ready, in sequence order. The first packet of a new sender session
+        carries "session_start": True so callers can reset timebases.
+        """
+        if now is None:
+            now = time.monotonic()
+        seq = raw_data.get("seq")
+        if seq is None:
+            return [raw_data]
+
+        source_id = raw_data.get("source", "unknown")
+        session = raw_data.get("session")
+        state = self.sources.get(source_id)
+        released = []
+
+        if state is None:
+            state = self.sources[source_id] = SourceState(session)
+            raw_data["session_start"] = True
+        elif state.session != session:
+            if state.is_older(session):
+                state.stale += 1
+                return released
+            # Sender restarted - flush what we have from the old session
+            released.extend(self._release(state, flush=True))
+            state.start_session(session)
+            state.restarts += 1
+            print(f"Source {source_id} restarted (session {session})")
+            raw_data["session_start"] = True
+
+        state.received += 1
+        if state.next_seq is None:
+            state.next_seq = seq
+            state.max_seen = seq
+
+        if seq < state.next_seq:
+            if seq in state.skipped:
+                # Arrived after its gap was given up on
+                state.skipped.discard(seq)
+                state.lost -= 1
+                state.late += 1
+            else:
+                state.duplicates += 1
+            return released
+        if seq in state.pending:
+            state.duplicates += 1
+            return released
+
+        if seq < state.max_seen:
+            state.reordered += 1
+        state.max_seen = max(state.max_seen, seq)
+        state.pending[seq] = (raw_data, now)
+
+        released.extend(self._release(state))
+        return released
+
+    def poll(self, now=None):
+        """
+        Release packets held behind gaps older than max_hold. Call this
+        regularly, also when no packet was received.
+        """
+        if now is None:
+            now = time.monotonic()
+        released = []
+        for state in self.sources.values():
+            if state.pending:
+                released.extend(self._release(state, deadline=now - self.max_hold))
+        return released
+
+    def _release(self, state, deadline=None, flush=False):
+        """
+        Deliver consecutive packets. A gap is skipped (counted as lost) when
+        the window overflows, when the packets behind it arrived before
+        deadline, or when flushing.
+        """
+        released = []
+        while state.pending:
+            if state.next_seq not in state.pending:
+                expired = deadline is not None and \
+                    min(arrival for _, arrival in state.pending.values()) <= deadline
+                if not (flush or expired or len(state.pending) > self.window):
+                    break
+                first = min(state.pending)
+                state.skipped.update(range(state.next_seq, first))
+                state.lost += first - state.next_seq
+                state.next_seq = first
+            raw_data, _ = state.pending.pop(state.next_seq)
+            released.append(raw_data)
+            state.delivered += 1
+            state.next_seq += 1
+
+        # Keep the late-arrival lookup bounded
+        if len(state.skipped) > 4 * self.window:
+            state.skipped = {s for s in state.skipped if s >= state.next_seq - 4 * self.window}
+        return released
+
+    def stats(self):
+        """
+        Per-source counters and rates
+        """
+        return {
+            source_id: {
+                "received": state.received,
+                "delivered": state.delivered,
+                "lost": state.lost,
+                "late": state.late,
+                "duplicates": state.duplicates,
+                "stale": state.stale,
+                "restarts": state.restarts,
+                "loss_rate": state.loss_rate(),
+                "reorder_rate": state.reorder_rate(),
+            }
+            for source_id, state in self.sources.items()
+        }
+
+    def print_stats(self, now=None, interval=STATS_INTERVAL):
+        """
+        Print a one-line summary per source at most every interval seconds
+        """
+        if now is None:
+            now = time.monotonic()
+        if now - self.last_stats < interval:
+            return
+        self.last_stats = now
+        for source_id, s in self.stats().items():
+            print(f"[{source_id}] delivered={s['delivered']} lost={s['lost']} "
+                  f"({s['loss_rate']*100:.1f}%) reordered={s['reorder_rate']*100:.1f}% "
+                  f"late={s['late']} dup={s['duplicates']} stale={s['stale']}")
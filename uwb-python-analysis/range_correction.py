@@ -0,0 +1,137 @@
+import numpy as np
+
+# Lookup table resolution - 5 mm keeps the table error far below UWB noise
+LUT_STEP_MM = 5.0
+LUT_MARGIN_MM = 5000.0    # table covers the room diagonal plus this margin
+TABLE_BIN_MM = 500.0      # distance bins when fitting tables from calibration data
+TABLE_MIN_COUNT = 30      # samples a bin needs to get its own table point
+
+
+def bias_curve(anchor, distances_mm):
+    """
+    Range error (measured - true) in mm of one anchor at the given true
+    distances, from its config entry:
+        "range_bias_mm": constant offset
+        "bias_table": {"distance_mm": [...], "correction_mm": [...]}  piecewise linear
+        "bias_poly": [c0, c1, c2, ...]  polynomial in metres, result in mm
+    Raises ValueError for malformed entries.
+    """
+    offset = anchor.get("range_bias_mm", 0.0)
+    if isinstance(offset, bool) or not isinstance(offset, (int, float)) or not np.isfinite(offset):
+        raise ValueError("range_bias_mm must be a number")
+    curve = np.full(len(distances_mm), float(offset))
+    table = anchor.get("bias_table")
+    if table:
+        if not isinstance(table, dict):
+            raise ValueError("bias_table must be an object")
+        table_d = numeric_list(table.get("distance_mm"), "bias_table.distance_mm")
+        table_e = numeric_list(table.get("correction_mm"), "bias_table.correction_mm")
+        if len(table_d) != len(table_e):
+            raise ValueError("bias_table distance_mm and correction_mm differ in length")
+        if np.any(np.diff(table_d) <= 0):
+            raise ValueError("bias_table distance_mm must be increasing")
+        # np.interp holds the end values outside the table
+        curve += np.interp(distances_mm, table_d, table_e)
+    poly = anchor.get("bias_poly")
+    if poly:
+        curve += np.polynomial.polynomial.polyval(distances_mm / 1000.0, numeric_list(poly, "bias_poly"))
+    return curve
+
+
+def numeric_list(values, name):
+    """
+    A non-empty list of finite numbers as a float array, or ValueError
+    """
+    if not isinstance(values, list) or not values or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        raise ValueError(f"{name} must be a non-empty list of numbers")
+    array = np.array(values, dtype=float)
+    if not np.all(np.isfinite(array)):
+        raise ValueError(f"{name} must be a non-empty list of numbers")
+    return array
+
+
+class RangeCorrector:
+    """
+    Per-anchor range bias correction through dense lookup tables.
+
+    The bias curve of every anchor is sampled once at LUT_STEP_MM, so
+    correcting a sample is an index computation and one array read,
+    independent of how the curve was specified. All methods work on whole
+    batches at once.
+    """
+    def __init__(self, anchors, anchor_ids, max_range_mm, include_bias=True):
+        self.anchor_ids = list(anchor_ids)
+        self.index = {addr: i for i, addr in enumerate(self.anchor_ids)}
+        self.step = LUT_STEP_MM
+        self.inv_step = 1.0 / LUT_STEP_MM
+        n_bins = int(np.ceil((max_range_mm + LUT_MARGIN_MM) * self.inv_step)) + 1
+        grid = np.arange(n_bins) * self.step
+        self.lut = np.zeros((len(self.anchor_ids), n_bins))
+        for i, addr in enumerate(self.anchor_ids):
+            anchor = dict(anchors[addr])
+            if not include_bias:
+                anchor.pop("range_bias_mm", None)
+            try:
+                self.lut[i] = bias_curve(anchor, grid)
+            except ValueError as e:
+                raise ValueError(f"anchor {addr}: {e}")
+        self.last_bin = n_bins - 1
+        self.is_identity = not np.any(self.lut)
+
+    def correct(self, anchor_idx, distances):
+        """
+        Corrected distances for arrays of anchor indices and raw distances in mm.
+        NaN distances stay NaN.
+        """
+        distances = np.asarray(distances, dtype=float)
+        if self.is_identity:
+            return distances.copy()
+        valid = np.isfinite(distances)
+        bins = np.rint(np.where(valid, distances, 0.0) * self.inv_step).astype(np.intp)
+        np.clip(bins, 0, self.last_bin, out=bins)
+        return distances - self.lut[anchor_idx, bins]
+
+    def correct_matrix(self, ranges):
+        """
+        Correct an (epochs x anchors) array with columns in anchor order
+        """
+        ranges = np.asarray(ranges, dtype=float)
+        return self.correct(np.arange(ranges.shape[1])[None, :], ranges)
+
+    def correct_ranges(self, distances):
+        """
+        Correct a {anchor: distance} packet. Unknown anchors pass through.
+        """
+        if self.is_identity or not distances:
+            return dict(distances)
+        known = [addr for addr in distances if addr in self.index]
+        corrected = dict(distances)
+        if known:
+            values = self.correct([self.index[addr] for addr in known],
+                                  [distances[addr] for addr in known])
+            corrected.update(zip(known, values.tolist()))
+        return corrected
+
+
+def fit_bias_table(true_distances, errors, bin_mm=TABLE_BIN_MM, min_count=TABLE_MIN_COUNT):
+    """
+    Piecewise-linear bias table from calibration residuals of one anchor.
+    errors are measured - true in mm. Each distance bin with enough samples
+    contributes its median error at the median distance. Returns None if
+    fewer than two bins qualify.
+    """
+    true_distances = np.asarray(true_distances, dtype=float)
+    errors = np.asarray(errors, dtype=float)
+    bins = np.floor(true_distances / bin_mm).astype(np.intp)
+    order = np.argsort(bins, kind="stable")
+    bins, true_distances, errors = bins[order], true_distances[order], errors[order]
+    edges = np.flatnonzero(np.diff(bins)) + 1
+    points_d, points_e = [], []
+    for d, e in zip(np.split(true_distances, edges), np.split(errors, edges)):
+        if len(d) >= min_count:
+            points_d.append(round(float(np.median(d)), 1))
+            points_e.append(round(float(np.median(e)), 1))
+    if len(points_d) < 2:
+        return None
+    return {"distance_mm": points_d, "correction_mm": points_e}
@@ -0,0 +1,123 @@
+import json
+import socket
+import threading
+import time
+from display_smoother import DisplaySmoother
+
+# Fixed-rate output settings
+OUTPUT_RATE_HZ = 50.0
+STALE_AFTER = 0.5          # seconds without a fix before samples are flagged stale
+SPIN_MARGIN = 0.001        # seconds before a deadline to stop sleeping and spin
+
+
+class FixedRateOutput:
+    """
+    Emits one sample per tag at a fixed rate, independent of packet arrival.
+
+    Each tick samples the filter prediction of every tag (last fix
+    extrapolated along its velocity) at the tick instant. Samples carry the
+    wall-clock time, the age of the underlying fix and a stale flag once
+    no fix arrived for STALE_AFTER seconds. The timer sleeps until just
+    before each absolute deadline and spins the rest, so deadlines do not
+    drift and jitter is typically below a millisecond (heavy Python work in
+    other threads adds up to the interpreter switch interval). Ticks missed
+    under load are skipped, not bunched.
+    """
+    def __init__(self, rate_hz=OUTPUT_RATE_HZ, stale_after=STALE_AFTER, smooth=False):
+        self.period = 1.0 / rate_hz
+        self.stale_after = stale_after
+        self.smooth = smooth
+        self.predictors = {}
+        self.predictors_lock = threading.Lock()
+        self.sinks = []
+        self.tick = 0
+        self.skipped = 0
+        self.max_jitter = 0.0
+        self.running = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def add_sink(self, callback):
+        """
+        callback(samples) receives the list of per-tag samples of each tick
+        """
+        self.sinks.append(callback)
+
+    def update(self, tag, t, position, velocity=None):
+        """
+        Feed a new fix of tag measured at t (time.monotonic())
+        """
+        with self.predictors_lock:
+            predictor = self.predictors.get(tag)
+            if predictor is None:
+                predictor = self.predictors[tag] = DisplaySmoother()
+        predictor.update(t, position, velocity)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def sample(self, now_mono, now_wall):
+        with self.predictors_lock:
+            predictors = list(self.predictors.items())
+        samples = []
+        for tag, predictor in predictors:
+            position = predictor.position(now_mono) if self.smooth else predictor.predict(now_mono)
+            if position is None:
+                continue
+            age = predictor.age(now_mono)
+            samples.append({
+                "tag": tag,
+                "t": now_wall,
+                "seq": self.tick,
+                "position": [round(float(v), 1) for v in position],
+                "age": round(age, 4),
+                "stale": age > self.stale_after,
+            })
+        return samples
+
+    def _run(self):
+        deadline = time.monotonic() + self.period
+        while self.running:
+            remaining = deadline - time.monotonic()
+            if remaining > SPIN_MARGIN:
+                time.sleep(remaining - SPIN_MARGIN)
+            while time.monotonic() < deadline:
+                time.sleep(0)   # yield the GIL to the packet loop while spinning
+
+            now = time.monotonic()
+            self.max_jitter = max(self.max_jitter, now - deadline)
+            samples = self.sample(now, time.time())
+            if samples:
+                for callback in self.sinks:
+                    try:
+                        callback(samples)
+                    except Exception as e:
+                        print(f"Output sink failed: {e}")
+            self.tick += 1
+
+            deadline += self.period
+            late = time.monotonic() - deadline
+            if late > 0:
+                missed = int(late // self.period) + 1
+                self.skipped += missed
+                self.tick += missed
+                deadline += missed * self.period
+
+
+def udp_sink(address):
+    """
+    Sink that sends each sample as one JSON datagram to address (host, port)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(samples):
+        for sample in samples:
+            try:
+                sock.sendto(json.dumps(sample).encode(), address)
+            except OSError:
+                pass
+    return send
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from range_correction import RangeCorrector
+from zone_engine import Zone
+
+# Shared room/anchor configuration for both visualizers
+DEFAULT_CONFIG_PATH = os.environ.get(
+    "UWB_ROOM_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "room_config.json"))
+RELOAD_INTERVAL = 1.0  # seconds between checks for a changed config file
+MIN_ANCHOR_SPREAD = 100.0  # mm the first three anchors must be apart and off one line
+
+
+def load_room_config(path=DEFAULT_CONFIG_PATH):
+    """
+    Read and validate the room/anchor configuration file (JSON).
+    Raises ValueError if the file is incomplete.
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: expected a JSON object")
+
+    room = config.get("room", {})
+    if not isinstance(room, dict):
+        raise ValueError(f"{path}: room must be an object")
+    for key in ("width_x", "depth_y", "height_z"):
+        if key not in room:
+            raise ValueError(f"{path}: room.{key} is missing")
+        if not is_number(room[key]) or room[key] <= 0:
+            raise ValueError(f"{path}: room.{key} must be a positive number")
+    anchors = config.get("anchors", {})
+    if not isinstance(anchors, dict):
+        raise ValueError(f"{path}: anchors must be an object keyed by anchor address")
+    if len(anchors) < 3:
+        raise ValueError(f"{path}: at least 3 anchors are required")
+    for addr, anchor in anchors.items():
+        if not isinstance(anchor, dict):
+            raise ValueError(f"{path}: anchor {addr} must be an object with a position")
+        position = anchor.get("position")
+        if not isinstance(position, list) or len(position) != 3 or not all(map(is_number, position)):
+            raise ValueError(f"{path}: anchor {addr} needs a 3D position in mm")
+    if not isinstance(config.get("zones", []), list):
+        raise ValueError(f"{path}: zones must be a list")
+    return config
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+
+class RoomGeometry:
+    """
+    Compiled, read-only view of a room configuration.
+
+    Everything that only depends on anchor positions is computed once here:
+    the trilateration basis for the first three anchors (3D and top-down 2D),
+    the linearised least-squares solver used when four or more anchors are
+    configured, the anchor-to-anchor distance matrix and the range
+    correction lookup tables.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.room = dict(config["room"])
+        self.room_diagonal = (self.room["width_x"]**2 +
+                              self.room["depth_y"]**2 +
+                              self.room["height_z"]**2)**0.5
+        self.room_diagonal_2d = (self.room["width_x"]**2 +
+                                 self.room["depth_y"]**2)**0.5
+
+        self.anchor_ids = list(config["anchors"])
+        self.index = {addr: i for i, addr in enumerate(self.anchor_ids)}
+        self.positions = np.array([config["anchors"][addr]["position"]
+                                   for addr in self.anchor_ids], dtype=float)
+        self.positions_2d = self.positions[:, :2].copy()
+
+        # Constant range offset per anchor (measured = true + bias), written by
+        # calibrate_anchors.py, and the full per-anchor correction tables
+        self.range_bias = {addr: float(config["anchors"][addr].get("range_bias_mm", 0.0))
+                           for addr in self.anchor_ids}
+        self.corrector = RangeCorrector(config["anchors"], self.anchor_ids, self.room_diagonal)
+
+        # Geofence zones, compiled here so a broken zone keeps the old config
+        self.zones = [Zone(spec) for spec in config.get("zones", [])]
+
+        # Anchor pair distances (N x N)
+        diff = self.positions[:, None, :] - self.positions[None, :, :]
+        self.pair_distances = np.linalg.norm(diff, axis=2)
+
+        first = ", ".join(self.anchor_ids[:3])
+        self.basis_3d = self._trilateration_basis(self.positions[:3], f"anchors {first}")
+        self.basis_2d = self._trilateration_basis(self.positions_2d[:3], f"anchors {first} (top view)")
+
+        # Linearised multilateration: subtracting the first range equation from
+        # the others gives A p = b, with A fixed by the anchor layout
+        self.lsq_matrix = None
+        if len(self.anchor_ids) >= 4:
+            A = 2.0 * (self.positions[1:] - self.positions[0])
+            if np.linalg.matrix_rank(A) == 3:
+                self.lsq_matrix = np.linalg.pinv(A)
+            self.lsq_offset = (np.sum(self.positions[1:]**2, axis=1) -
+                               np.sum(self.positions[0]**2))
+
+    @staticmethod
+    def _trilateration_basis(points, name):
+        """
+        Frame for closed-form trilateration from the first three anchors.
+        Raises ValueError if they coincide or lie on one line, which would
+        turn every fix into NaN.
+        """
+        P1, P2, P3 = points
+        d = np.linalg.norm(P2 - P1)
+        if d < MIN_ANCHOR_SPREAD:
+            raise ValueError(f"{name}: the first two anchors are at the same position")
+        ex = (P2 - P1) / d
+        i = np.dot(ex, P3 - P1)
+        ey = P3 - P1 - i * ex
+        if np.linalg.norm(ey) < MIN_ANCHOR_SPREAD:
+            raise ValueError(f"{name}: the first three anchors lie on one line")
+        ey = ey / np.linalg.norm(ey)
+        j = np.dot(ey, P3 - P1)
+        basis = {"origin": P1, "ex": ex, "ey": ey, "d": d, "i": i, "j": j}
+        if len(P1) == 3:
+            basis["ez"] = np.cross(ex, ey)
+        return basis
+
+    def correct_ranges(self, distances):
+        """
+        Remove the calibrated per-anchor bias from raw distances in mm
+        """
+        return self.corrector.correct_ranges(distances)
+
+    def ranges_array(self, distances):
+        """
+        Ranges in anchor order, or None if any configured anchor is missing
+        """
+        try:
+            return np.array([distances[addr] for addr in self.anchor_ids], dtype=float)
+        except KeyError:
+            return None
+
+    def trilaterate_3d(self, ranges):
+        """
+        Estimated position in mm (x, y, z) from ranges in anchor order
+        """
+        if self.lsq_matrix is not None:
+            b = ranges[0]**2 - ranges[1:]**2 + self.lsq_offset
+            return self.lsq_matrix @ b
+
+        b = self.basis_3d
+        r1, r2, r3 = ranges[:3]
+        x = (r1**2 - r2**2 + b["d"]**2) / (2 * b["d"])
+        y = (r1**2 - r3**2 + b["i"]**2 + b["j"]**2 - 2 * b["i"] * x) / (2 * b["j"])
+        z = np.sqrt(abs(r1**2 - x**2 - y**2))
+        return b["origin"] + x * b["ex"] + y * b["ey"] + z * b["ez"]
+
+    def trilaterate_2d(self, ranges):
+        """
+        Estimated top-down position in mm (x, y) from ranges in anchor order
+        """
+        b = self.basis_2d
+        r1, r2, r3 = ranges[:3]
+        x = (r1**2 - r2**2 + b["d"]**2) / (2 * b["d"])
+        y = (r1**2 - r3**2 + b["i"]**2 + b["j"]**2 - 2 * b["i"] * x) / (2 * b["j"])
+        return b["origin"] + x * b["ex"] + y * b["ey"]
+
+    def velocity_from_range_rates(self, position, rates):
+        """
+        Horizontal tag velocity in mm/s from range rates (mm/s, anchor order)
+        at a position (x, y) or (x, y, z). Each range rate is the velocity
+        projected on the line of sight, so the velocity is the least-squares
+        solution of those projections. The vertical component is returned as 0
+        since height is not tracked by the filters.
+        """
+        position = np.asarray(position, dtype=float)
+        delta = position - self.positions[:, :len(position)]
+        unit = delta / np.maximum(np.linalg.norm(delta, axis=1), 1e-9)[:, None]
+        velocity = np.zeros(len(position))
+        velocity[:2] = np.linalg.lstsq(unit[:, :2], rates, rcond=None)[0]
+        return velocity
+
+    def changed_anchors(self, other):
+        """
+        Anchors that were removed, moved or re-biased in other compared to this geometry.
+        Range filters for these anchors are no longer valid.
+        """
+        changed = set()
+        for addr in self.anchor_ids:
+            if addr not in other.index:
+                changed.add(addr)
+            elif not np.array_equal(self.positions[self.index[addr]],
+                                    other.positions[other.index[addr]]):
+                changed.add(addr)
+            elif not np.array_equal(self.corrector.lut[self.index[addr]],
+                                    other.corrector.lut[other.index[addr]]):
+                changed.add(addr)
+        return changed
+
+
+class ConfigWatcher:
+    """
+    Watches the config file and swaps in a newly compiled RoomGeometry when
+    it changes. Loading and compiling happen on a background thread; the
+    swap itself is a single reference assignment, so readers always see
+    either the old or the new geometry. A broken file is reported and the
+    previous geometry is kept.
+    """
+    def __init__(self, path=DEFAULT_CONFIG_PATH, interval=RELOAD_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.mtime = os.stat(path).st_mtime
+        self.geometry = RoomGeometry(load_room_config(path))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                continue
+            if mtime == self.mtime:
+                continue
+            self.mtime = mtime
+            try:
+                geometry = RoomGeometry(load_room_config(self.path))
+            except Exception as e:
+                # Malformed entries raise ValueError; anything unforeseen must
+                # not end the watcher either
+                print(f"Config reload failed, keeping previous layout: {type(e).__name__}: {e}")
+                continue
+            self.geometry = geometry
+            print(f"Reloaded room config: {len(geometry.anchor_ids)} anchors")
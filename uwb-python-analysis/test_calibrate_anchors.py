@@ -0,0 +1,155 @@
+"""
+Synthetic ground-truth tests for calibrate_anchors.py
+
+A simulated walk through a room with known anchor positions and range
+biases is written as a recorded session, then solved from a perturbed
+config. Run with pytest or directly:
+    python test_calibrate_anchors.py
+"""
+import argparse
+import json
+import os
+import tempfile
+import numpy as np
+
+import calibrate_anchors
+
+ROOM = {"width_x": 8428, "depth_y": 7822, "height_z": 3200}
+ANCHOR_IDS = ["0x0001", "0x0002", "0x0003", "0x0004"]
+TRUE_POSITIONS = np.array([[2968.0, 0.0, 2040.0], [0.0, 4007.0, 2250.0],
+                           [4432.0, 7375.0, 1800.0], [8428.0, 3500.0, 2600.0]])
+TRUE_DELAY = np.array([30.0, -90.0, 70.0, -20.0])     # per anchor, mm
+TAG_DELAY = 50.0                                       # mm
+PRIOR_ERROR = np.array([[40.0, -30.0, 10.0], [-20.0, 45.0, -15.0],
+                        [100.0, 60.0, -70.0], [-80.0, 50.0, 60.0]])
+NOISE = 30.0                                           # mm
+
+
+def walk(n, rng, dt=0.1):
+    """
+    Random walk at up to 1.2 m/s, tag held between 0.3 and 2.2 m
+    """
+    low = np.array([300.0, 300.0, 300.0])
+    high = np.array([ROOM["width_x"] - 300.0, ROOM["depth_y"] - 300.0, 2200.0])
+    position = np.array([4000.0, 4000.0, 1200.0])
+    velocity = np.zeros(3)
+    track = np.empty((n, 3))
+    for k in range(n):
+        velocity = 0.98 * (velocity + rng.normal(0, [150.0, 150.0, 60.0]) * dt * 3)
+        speed = np.linalg.norm(velocity[:2])
+        if speed > 1200:
+            velocity[:2] *= 1200 / speed
+        position += velocity * dt
+        outside = (position < low) | (position > high)
+        velocity[outside] *= -1
+        position = np.clip(position, low, high)
+        track[k] = position
+    return track
+
+
+def write_case(directory, seconds=3600, seed=1):
+    """
+    Session, config and anchor ranges for a simulated calibration walk
+    """
+    rng = np.random.default_rng(seed)
+    tags = walk(int(seconds * 10), rng)
+    ranges = (np.linalg.norm(tags[:, None, :] - TRUE_POSITIONS[None], axis=2) +
+              TRUE_DELAY + TAG_DELAY + rng.normal(0, NOISE, (len(tags), len(ANCHOR_IDS))))
+    session = os.path.join(directory, "session.jsonl")
+    with open(session, "w") as f:
+        for row in ranges:
+            f.write(json.dumps({"distances": dict(zip(ANCHOR_IDS, row.tolist()))}) + "\n")
+
+    config = os.path.join(directory, "room_config.json")
+    anchors = {addr: {"position": position.tolist()}
+               for addr, position in zip(ANCHOR_IDS, TRUE_POSITIONS + PRIOR_ERROR)}
+    with open(config, "w") as f:
+        json.dump({"room": ROOM, "anchors": anchors, "zones": []}, f)
+
+    anchor_ranges = os.path.join(directory, "anchor_ranges.json")
+    pairs = []
+    for a in range(len(ANCHOR_IDS)):
+        for b in range(a + 1, len(ANCHOR_IDS)):
+            distance = np.linalg.norm(TRUE_POSITIONS[a] - TRUE_POSITIONS[b])
+            pairs.append({"a": ANCHOR_IDS[a], "b": ANCHOR_IDS[b],
+                          "distance_mm": distance + TRUE_DELAY[a] + TRUE_DELAY[b]})
+    with open(anchor_ranges, "w") as f:
+        json.dump(pairs, f)
+    return session, config, anchor_ranges
+
+
+def solve_args(session, config, anchor_ranges=None, max_iterations=calibrate_anchors.MAX_ITERATIONS):
+    return argparse.Namespace(sessions=[session], anchor_ranges=anchor_ranges, config=config,
+                              max_epochs=calibrate_anchors.MAX_EPOCHS, max_iterations=max_iterations,
+                              prior_sigma=calibrate_anchors.PRIOR_SIGMA, bias_tables=False,
+                              dry_run=False)
+
+
+def rigid_fit(source, target):
+    """
+    source moved by the rotation and translation that best fit it onto target
+    """
+    source_center, target_center = source.mean(axis=0), target.mean(axis=0)
+    U, _, Vt = np.linalg.svd((source - source_center).T @ (target - target_center))
+    D = np.diag([1.0, 1.0, np.sign(np.linalg.det(U @ Vt))])
+    return (source - source_center) @ U @ D @ Vt + target_center
+
+
+def test_recovers_anchor_layout_and_bias():
+    with tempfile.TemporaryDirectory() as directory:
+        session, config, _ = write_case(directory)
+        prior = TRUE_POSITIONS + PRIOR_ERROR
+        _, anchors, bias, _, _, report = calibrate_anchors.calibrate(solve_args(session, config))
+        assert report["converged"]
+
+        # Ranges do not fix the layout's placement in the room; compare
+        # against the true layout in the frame the priors define
+        reference = rigid_fit(TRUE_POSITIONS, prior)
+        error = np.linalg.norm(anchors - reference, axis=1)
+        prior_error = np.linalg.norm(prior - reference, axis=1)
+        assert np.all(error < 35), error
+        assert np.all(error < prior_error), (error, prior_error)
+        assert np.all(np.abs(bias - (TRUE_DELAY + TAG_DELAY)) < 40), bias
+
+        with open(config, "r") as f:
+            written = json.load(f)["anchors"]
+        for i, addr in enumerate(ANCHOR_IDS):
+            assert np.allclose(written[addr]["position"], anchors[i], atol=0.1)
+            assert abs(written[addr]["range_bias_mm"] - bias[i]) <= 0.1
+
+
+def test_anchor_ranges_solve_tag_delay():
+    with tempfile.TemporaryDirectory() as directory:
+        session, config, anchor_ranges = write_case(directory)
+        _, anchors, bias, _, _, report = calibrate_anchors.calibrate(
+            solve_args(session, config, anchor_ranges))
+        assert report["converged"]
+        assert abs(report["tag_delay"] - TAG_DELAY) < 25, report["tag_delay"]
+        delay = bias - report["tag_delay"]
+        for a in range(len(ANCHOR_IDS)):
+            for b in range(a + 1, len(ANCHOR_IDS)):
+                measured = np.linalg.norm(TRUE_POSITIONS[a] - TRUE_POSITIONS[b]) + TRUE_DELAY[a] + TRUE_DELAY[b]
+                modelled = np.linalg.norm(anchors[a] - anchors[b]) + delay[a] + delay[b]
+                assert abs(modelled - measured) < 20
+
+
+def test_no_write_without_convergence():
+    with tempfile.TemporaryDirectory() as directory:
+        session, config, _ = write_case(directory, seconds=300)
+        with open(config, "r") as f:
+            before = f.read()
+        try:
+            calibrate_anchors.calibrate(solve_args(session, config, max_iterations=1))
+        except SystemExit as e:
+            assert e.code == 1
+        else:
+            raise AssertionError("calibrate() wrote a config from a solve that did not converge")
+        with open(config, "r") as f:
+            assert f.read() == before
+
+
+if __name__ == "__main__":
+    test_recovers_anchor_layout_and_bias()
+    test_anchor_ranges_solve_tag_delay()
+    test_no_write_without_convergence()
+    print("All calibration tests passed")
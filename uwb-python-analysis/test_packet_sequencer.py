@@ -0,0 +1,110 @@
+"""
+Tests for packet_sequencer.py. Run with pytest or directly:
+    python test_packet_sequencer.py
+"""
+from packet_sequencer import MAX_HOLD_TIME, ClockOffset, PacketSequencer
+
+
+def packet(seq, session=1000, source="tag1"):
+    return {"source": source, "session": session, "seq": seq, "distances": {}}
+
+
+def seqs(packets):
+    return [(p["session"], p["seq"]) for p in packets]
+
+
+def test_reorder_within_window():
+    sequencer = PacketSequencer()
+    released = []
+    for seq in (0, 2, 1, 3):
+        released += sequencer.push(packet(seq), now=0.0)
+    assert seqs(released) == [(1000, 0), (1000, 1), (1000, 2), (1000, 3)]
+    stats = sequencer.stats()["tag1"]
+    assert stats["lost"] == 0 and stats["delivered"] == 4
+    assert stats["reorder_rate"] == 0.25
+
+
+def test_gap_times_out_and_late_packet_is_dropped():
+    sequencer = PacketSequencer()
+    released = sequencer.push(packet(0), now=0.0)
+    released += sequencer.push(packet(2), now=0.01)
+    assert seqs(released) == [(1000, 0)]
+    assert sequencer.poll(now=0.01 + MAX_HOLD_TIME / 2) == []
+    released = sequencer.poll(now=0.02 + MAX_HOLD_TIME)
+    assert seqs(released) == [(1000, 2)]
+    assert sequencer.stats()["tag1"]["lost"] == 1
+
+    # seq 1 shows up after its gap was given up on
+    assert sequencer.push(packet(1), now=0.1) == []
+    stats = sequencer.stats()["tag1"]
+    assert stats["lost"] == 0 and stats["late"] == 1
+
+
+def test_window_overflow_releases_without_timeout():
+    sequencer = PacketSequencer(window=3)
+    released = sequencer.push(packet(0), now=0.0)
+    for seq in range(2, 6):
+        released += sequencer.push(packet(seq), now=0.0)
+    assert seqs(released) == [(1000, s) for s in (0, 2, 3, 4, 5)]
+
+
+def test_old_session_packet_after_restart_is_dropped():
+    sequencer = PacketSequencer()
+    released = []
+    for seq in range(5):
+        released += sequencer.push(packet(seq, session=1000), now=0.0)
+    released += sequencer.push(packet(0, session=2000), now=0.1)
+    assert released[-1]["session_start"]
+    starts = len([p for p in released if p.get("session_start")])
+
+    # Delayed packet of the old session, then the new session goes on
+    assert sequencer.push(packet(5, session=1000), now=0.11) == []
+    late = sequencer.push(packet(1, session=2000), now=0.12)
+    assert seqs(late) == [(2000, 1)]
+    assert not late[0].get("session_start")
+    assert starts == 2    # the first packet ever, and the restart
+
+    stats = sequencer.stats()["tag1"]
+    assert stats["restarts"] == 1
+    assert stats["stale"] == 1
+    assert stats["received"] == 7
+    assert stats["delivered"] == 7
+
+
+def test_counters_survive_restart():
+    sequencer = PacketSequencer()
+    sequencer.push(packet(0, session=1000), now=0.0)
+    sequencer.push(packet(2, session=1000), now=0.0)
+    sequencer.poll(now=1.0)
+    sequencer.push(packet(0, session=2000), now=1.1)
+    stats = sequencer.stats()["tag1"]
+    assert stats["lost"] == 1
+    assert stats["reorder_rate"] == 0.0
+    assert stats["received"] == 3 and stats["delivered"] == 3
+
+
+def test_clock_offset_recovers_measurement_instant():
+    clock = ClockOffset(drift=0.0)
+    # Sender clock runs 500 s behind; delays of 30, 5 and 60 ms
+    instants = [clock.measured_at({"source": "tag1", "mono": mono, "arrival": mono + 500.0 + delay})
+                for mono, delay in ((1.0, 0.030), (1.1, 0.005), (1.2, 0.060))]
+    assert abs(instants[1] - 501.105) < 1e-9
+    assert abs(instants[2] - 501.205) < 1e-9     # the 60 ms delay is compensated
+
+    # A restarted sender starts a new timebase
+    restarted = clock.measured_at({"source": "tag1", "mono": 0.5, "arrival": 600.0,
+                                   "session_start": True})
+    assert restarted == 600.0
+
+    # Older senders without mono are placed at their arrival
+    assert clock.measured_at({"source": "tag2", "arrival": 42.0}) == 42.0
+
+
+if __name__ == "__main__":
+    test_reorder_within_window()
+    test_gap_times_out_and_late_packet_is_dropped()
+    test_window_overflow_releases_without_timeout()
+    test_old_session_packet_after_restart_is_dropped()
+    test_counters_survive_restart()
+    test_clock_offset_recovers_measurement_instant()
+    print("All sequencer tests passed")
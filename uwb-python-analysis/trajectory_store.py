@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# Retention tiers, finest first. Sealed partitions of one tier are averaged
+# into the next tier, partitions older than "keep" seconds are dropped.
+TIERS = [
+    {"resolution": 0.0,  "partition": 60.0,   "keep": 3600.0},        # raw, 1 hour
+    {"resolution": 1.0,  "partition": 900.0,  "keep": 86400.0},       # 1 s, 1 day
+    {"resolution": 10.0, "partition": 3600.0, "keep": 7 * 86400.0},   # 10 s, 1 week
+]
+INDEX_CELL_MM = 500.0       # spatial index cell size of sealed partitions
+OCCUPANCY_CELL_MM = 250.0   # heatmap cell size
+MAX_DWELL_GAP = 1.0         # seconds; longer gaps between fixes do not count as dwell
+
+
+class Partition:
+    """
+    Append-only block of fixes covering [t_start, t_start + duration).
+    While open it grows by doubling; once sealed the arrays are trimmed and
+    a uniform-grid index (points sorted by cell) is built for box queries.
+    """
+    def __init__(self, t_start, duration, capacity=256):
+        self.t_start = t_start
+        self.t_end = t_start + duration
+        self.size = 0
+        self.t = np.empty(capacity)
+        self.xyz = np.empty((capacity, 3), dtype=np.float32)
+        self.sealed = False
+        self.cell_keys = None
+        self.order = None
+        self.lo = None
+        self.hi = None
+
+    def append(self, t, xyz):
+        if self.size == len(self.t):
+            self.t = np.resize(self.t, 2 * self.size)
+            self.xyz = np.resize(self.xyz, (2 * self.size, 3))
+        self.t[self.size] = t
+        self.xyz[self.size] = xyz
+        self.size += 1
+
+    def seal(self):
+        self.t = self.t[:self.size].copy()
+        self.xyz = self.xyz[:self.size].copy()
+        self.sealed = True
+        if self.size == 0:
+            return
+        self.lo = self.xyz.min(axis=0)
+        self.hi = self.xyz.max(axis=0)
+        cells = np.floor(self.xyz[:, :2] / INDEX_CELL_MM).astype(np.int64)
+        keys = cells[:, 0] * 1_000_003 + cells[:, 1]
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys = keys[self.order]
+
+    def select(self, t_start, t_end, bbox=None):
+        """
+        Indices of fixes inside the time range and optional box
+        ((x_min, y_min, z_min), (x_max, y_max, z_max)), in time order
+        """
+        if self.size == 0 or t_end < self.t_start or t_start >= self.t_end:
+            return np.empty(0, dtype=np.intp)
+        t = self.t[:self.size]
+        if bbox is None:
+            first, last = np.searchsorted(t, [t_start, t_end], side="left")
+            return np.arange(first, last)
+
+        lo, hi = np.asarray(bbox[0], dtype=float), np.asarray(bbox[1], dtype=float)
+        if self.sealed:
+            if np.any(self.hi < lo) or np.any(self.lo > hi):
+                return np.empty(0, dtype=np.intp)
+            # Gather candidates cell by cell from the sorted index
+            cx = np.arange(np.floor(lo[0] / INDEX_CELL_MM), np.floor(hi[0] / INDEX_CELL_MM) + 1)
+            cy = np.arange(np.floor(lo[1] / INDEX_CELL_MM), np.floor(hi[1] / INDEX_CELL_MM) + 1)
+            if len(cx) * len(cy) < self.size:
+                keys = (cx[:, None].astype(np.int64) * 1_000_003 + cy[None, :].astype(np.int64)).ravel()
+                starts = np.searchsorted(self.cell_keys, keys, side="left")
+                ends = np.searchsorted(self.cell_keys, keys, side="right")
+                candidates = np.concatenate([self.order[s:e] for s, e in zip(starts, ends)] or
+                                            [np.empty(0, dtype=np.intp)])
+                candidates.sort()
+            else:
+                candidates = np.arange(self.size)
+        else:
+            candidates = np.arange(self.size)
+
+        xyz = self.xyz[candidates]
+        mask = ((t[candidates] >= t_start) & (t[candidates] < t_end) &
+                np.all(xyz >= lo, axis=1) & np.all(xyz <= hi, axis=1))
+        return candidates[mask]
+
+
+class Tier:
+    """
+    Partitions of one resolution for one tag. Non-raw tiers receive
+    bin averages of the finer tier when its partitions are sealed.
+    """
+    def __init__(self, spec):
+        self.resolution = spec["resolution"]
+        self.duration = spec["partition"]
+        self.keep = spec["keep"]
+        self.partitions = deque()
+
+    def partition_for(self, t):
+        if self.partitions and t < self.partitions[-1].t_end:
+            return self.partitions[-1], []
+        sealed = []
+        if self.partitions and not self.partitions[-1].sealed:
+            self.partitions[-1].seal()
+            sealed.append(self.partitions[-1])
+        t_start = np.floor(t / self.duration) * self.duration
+        partition = Partition(t_start, self.duration)
+        self.partitions.append(partition)
+        return partition, sealed
+
+    def expire(self, now):
+        while self.partitions and self.partitions[0].t_end < now - self.keep:
+            self.partitions.popleft()
+
+    def covered_from(self):
+        return self.partitions[0].t_start if self.partitions else np.inf
+
+    def memory_bytes(self):
+        return sum(p.t.nbytes + p.xyz.nbytes for p in self.partitions)
+
+
+def downsample(t, xyz, resolution):
+    """
+    Average fixes into bins of resolution seconds
+    """
+    if len(t) == 0:
+        return t, xyz
+    bins = np.floor(t / resolution).astype(np.int64)
+    edges = np.flatnonzero(np.diff(bins)) + 1
+    starts = np.concatenate([[0], edges])
+    counts = np.diff(np.concatenate([starts, [len(t)]]))
+    t_mean = np.add.reduceat(t, starts) / counts
+    xyz_mean = np.add.reduceat(xyz.astype(np.float64), starts, axis=0) / counts[:, None]
+    return t_mean, xyz_mean
+
+
+class OccupancyGrid:
+    """
+    Dwell time in seconds per floor cell, updated incrementally per fix
+    """
+    def __init__(self, room, cell_mm=OCCUPANCY_CELL_MM):
+        self.cell_mm = cell_mm
+        self.shape = (int(np.ceil(room["width_x"] / cell_mm)), int(np.ceil(room["depth_y"] / cell_mm)))
+        self.seconds = np.zeros(self.shape)
+
+    def add(self, xyz, dwell):
+        ix = min(max(int(xyz[0] // self.cell_mm), 0), self.shape[0] - 1)
+        iy = min(max(int(xyz[1] // self.cell_mm), 0), self.shape[1] - 1)
+        self.seconds[ix, iy] += dwell
+
+
+class TrajectoryStore:
+    """
+    In-memory position history of every tag.
+
+    Fixes are appended to time partitions; old partitions are downsampled
+    into coarser tiers and eventually dropped, so memory stays bounded no
+    matter how long the engine runs. Queries take a time range and an
+    optional bounding box and return the finest data available for each
+    part of the range. An occupancy grid per tag (and one for all tags) is
+    updated with every fix.
+    """
+    def __init__(self, room, tiers=TIERS):
+        self.room = room
+        self.tier_specs = tiers
+        self.tags = {}
+        self.last_fix = {}
+        self.occupancy = {}
+        self.total_occupancy = OccupancyGrid(room)
+        self.lock = threading.Lock()
+
+    def append(self, tag, t, xyz):
+        """
+        Record a fix of tag at time t (seconds, wall clock) in mm
+        """
+        with self.lock:
+            tiers = self.tags.get(tag)
+            if tiers is None:
+                tiers = self.tags[tag] = [Tier(spec) for spec in self.tier_specs]
+                self.occupancy[tag] = OccupancyGrid(self.room)
+
+            previous = self.last_fix.get(tag)
+            if previous is not None and t < previous[0]:
+                return  # out-of-order fix, history is append-only
+
+            # Dwell is credited to where the tag was since the previous fix
+            if previous is not None:
+                dwell = t - previous[0]
+                if 0 < dwell <= MAX_DWELL_GAP:
+                    self.occupancy[tag].add(previous[1], dwell)
+                    self.total_occupancy.add(previous[1], dwell)
+            self.last_fix[tag] = (t, np.asarray(xyz, dtype=float))
+
+            partition, sealed = tiers[0].partition_for(t)
+            partition.append(t, xyz)
+            self._cascade(tiers, 0, sealed)
+            for tier in tiers:
+                tier.expire(t)
+
+    def _cascade(self, tiers, level, sealed):
+        if level + 1 >= len(tiers):
+            return
+        coarser = tiers[level + 1]
+        for partition in sealed:
+            t, xyz = downsample(partition.t, partition.xyz, coarser.resolution)
+            for row_t, row_xyz in zip(t, xyz):
+                target, more = coarser.partition_for(row_t)
+                target.append(row_t, row_xyz)
+                self._cascade(tiers, level + 1, more)
+
+    def query(self, tag, t_start, t_end, bbox=None):
+        """
+        Fixes of tag with t_start <= t < t_end, optionally inside bbox
+        ((x_min, y_min, z_min), (x_max, y_max, z_max)) in mm.
+        Returns (times, positions) sorted by time. Older parts of the range
+        come from coarser tiers.
+        """
+        with self.lock:
+            tiers = self.tags.get(tag)
+            if tiers is None:
+                return np.empty(0), np.empty((0, 3))
+            times, points = [], []
+            upper = t_end
+            for tier in tiers:
+                lower = max(t_start, tier.covered_from())
+                if lower < upper:
+                    for partition in tier.partitions:
+                        idx = partition.select(lower, upper, bbox)
+                        if len(idx):
+                            times.append(partition.t[idx])
+                            points.append(partition.xyz[idx].astype(float))
+                upper = min(upper, lower)
+                if upper <= t_start:
+                    break
+        if not times:
+            return np.empty(0), np.empty((0, 3))
+        times = np.concatenate(times)
+        points = np.concatenate(points)
+        order = np.argsort(times, kind="stable")
+        return times[order], points[order]
+
+    def last_hour(self, tag, bbox=None):
+        now = time.time()
+        return self.query(tag, now - 3600.0, now + 1.0, bbox)
+
+    def heatmap(self, tag=None, t_start=None, t_end=None, cell_mm=OCCUPANCY_CELL_MM):
+        """
+        Dwell seconds per floor cell. Without a time range this is the
+        incrementally maintained grid; with one it is computed from history.
+        """
+        if t_start is None and t_end is None and cell_mm == OCCUPANCY_CELL_MM:
+            with self.lock:
+                grid = self.total_occupancy if tag is None else self.occupancy.get(tag)
+                return grid.seconds.copy() if grid is not None else np.zeros(self.total_occupancy.shape)
+
+        t_start = -np.inf if t_start is None else t_start
+        t_end = np.inf if t_end is None else t_end
+        x_edges = np.arange(0, self.room["width_x"] + cell_mm, cell_mm)
+        y_edges = np.arange(0, self.room["depth_y"] + cell_mm, cell_mm)
+        result = np.zeros((len(x_edges) - 1, len(y_edges) - 1))
+        for name in ([tag] if tag is not None else list(self.tags)):
+            times, points = self.query(name, t_start, t_end)
+            if len(times) < 2:
+                continue
+            dwell = np.diff(times)
+            keep = dwell <= max(MAX_DWELL_GAP, self.tier_specs[-1]["resolution"])
+            hist, _, _ = np.histogram2d(points[:-1, 0][keep], points[:-1, 1][keep],
+                                        bins=(x_edges, y_edges), weights=dwell[keep])
+            result += hist
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                tag: {
+                    "points": [sum(p.size for p in tier.partitions) for tier in tiers],
+                    "bytes": sum(tier.memory_bytes() for tier in tiers),
+                }
+                for tag, tiers in self.tags.items()
+            }
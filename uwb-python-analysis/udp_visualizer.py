@@ -6,26 +6,31 @@ import json
 import time
 from filterpy.kalman import KalmanFilter
 from filterpy.common import Q_discrete_white_noise
+from packet_sequencer import ClockOffset, PacketSequencer, packet_time
+from room_geometry import ConfigWatcher
+from display_smoother import DisplaySmoother
+from trajectory_store import TrajectoryStore
+from zone_engine import ZoneEngine, print_listener, unix_socket_listener
+from resampled_output import FixedRateOutput, udp_sink
+from web_dashboard import Dashboard
 
-# Room dimensions in mm (x, y, z) - configured on computer side
-ROOM_DIMENSIONS = {
-    "width_x": 8428,    # mm (x-axis) - 8.428m
-    "depth_y": 7822,    # mm (y-axis) - 7.822m
-    "height_z": 3200    # mm (z-axis) - 3.2m
-}
-
-# Anchor positions in mm (x, y, z) - 3D coordinates
-responder_positions_3d = {
-    "0x0001": [2968, 0, 2040],      # mm (x, y, z) - (2.968, 0, 2.04) m
-    "0x0002": [0, 4007, 2250],      # mm (x, y, z) - (0, 4.007, 2.25) m
-    "0x0003": [4432, 7375, 1800]    # mm (x, y, z) - (4.432, 7.375, 1.80) m
-}
+# Room dimensions and anchor positions in mm live in room_config.json and
+# are reloaded automatically when the file changes
+config_watcher = ConfigWatcher().start()
+geometry = config_watcher.geometry
 
 # UDP setup
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5005
+# Set to the sender's multicast group (e.g. "239.255.50.5" for full rate,
+# "239.255.50.6" for 5 Hz) when position_sender.py runs in multicast mode
+MULTICAST_GROUP = None
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 sock.bind((UDP_IP, UDP_PORT))
+if MULTICAST_GROUP:
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                    socket.inet_aton(MULTICAST_GROUP) + socket.inet_aton("0.0.0.0"))
 sock.settimeout(0.005)
 
 # Kalman filter settings
@@ -33,16 +38,48 @@ INITIAL_DT = 0.1
 MEASUREMENT_NOISE = 10
 PROCESS_NOISE = 0.1
 
-# Kalman filters for each anchor
+# Kalman filters for each (source, anchor) pair, so every tag has its own
 kalman_filters = {}
 last_time = {}
 
+# Restores sender order and tracks loss per source
+sequencer = PacketSequencer()
+sender_clocks = ClockOffset()
+
+# Position history per tag (keyed by sender source id) for history queries
+# and occupancy heatmaps
+trajectory_store = TrajectoryStore(geometry.room)
+
+# Geofence events for the zones in room_config.json; set ZONE_EVENT_SOCKET to
+# a Unix datagram socket path to also publish them as JSON
+ZONE_EVENT_SOCKET = None
+zone_engine = ZoneEngine(geometry.zones)
+zone_engine.add_listener(print_listener)
+if ZONE_EVENT_SOCKET:
+    zone_engine.add_listener(unix_socket_listener(ZONE_EVENT_SOCKET))
+
+# Fixed-rate position stream for downstream consumers: one JSON sample per
+# tag every 1/OUTPUT_RATE_HZ seconds, predicted between fixes and flagged
+# stale when the fixes stop. Set OUTPUT_RATE_HZ = 0 to disable.
+OUTPUT_RATE_HZ = 50
+OUTPUT_ADDRESS = ("127.0.0.1", 5007)
+fixed_rate_output = None
+if OUTPUT_RATE_HZ:
+    fixed_rate_output = FixedRateOutput(OUTPUT_RATE_HZ)
+    fixed_rate_output.add_sink(udp_sink(OUTPUT_ADDRESS))
+    fixed_rate_output.start()
+
+# Live browser dashboard on http://<this host>:DASHBOARD_PORT/ (None disables
+# it). Viewers are served from their own threads and add no work to the
+# estimation loop. Set SHOW_PLOT = False to run without the matplotlib window.
+DASHBOARD_PORT = 8080
+SHOW_PLOT = True
+dashboard = None
+if DASHBOARD_PORT:
+    dashboard = Dashboard(geometry, DASHBOARD_PORT, trajectory_store=trajectory_store).start()
+
 # Sensor status tracking
-sensor_status = {
-    "0x0001": {"last_seen": 0, "color": "red"},
-    "0x0002": {"last_seen": 0, "color": "red"},
-    "0x0003": {"last_seen": 0, "color": "red"}
-}
+sensor_status = {addr: {"last_seen": 0, "color": "red"} for addr in geometry.anchor_ids}
 
 def create_kalman_filter():
     kf = KalmanFilter(dim_x=2, dim_z=1)
@@ -53,7 +90,32 @@ def create_kalman_filter():
     kf.Q = Q_discrete_white_noise(dim=2, dt=INITIAL_DT, var=PROCESS_NOISE)
     return kf
 
-def improve_height_decision(distances, room_dimensions):
+def refresh_geometry():
+    """
+    Switch to a reloaded room config. Filters of anchors that kept their
+    position and bias are preserved; changed or removed anchors start over.
+    """
+    global geometry
+    new_geometry = config_watcher.geometry
+    if new_geometry is geometry:
+        return
+    changed = set(geometry.changed_anchors(new_geometry))
+    for key in [key for key in kalman_filters if key[1] in changed]:
+        kalman_filters.pop(key, None)
+        last_time.pop(key, None)
+    for addr in changed:
+        print(f"Anchor {addr} changed or removed - filter reset")
+    for addr in list(sensor_status):
+        if addr not in new_geometry.index:
+            del sensor_status[addr]
+    for addr in new_geometry.anchor_ids:
+        sensor_status.setdefault(addr, {"last_seen": 0, "color": "red"})
+    zone_engine.set_zones(new_geometry.zones)
+    if dashboard is not None:
+        dashboard.set_geometry(new_geometry)
+    geometry = new_geometry
+
+def improve_height_decision(distances, geometry):
     """
     Improve height decision using room dimensions and anchor positions
     This runs on the computer side with full room context
@@ -64,13 +126,11 @@ def improve_height_decision(distances, room_dimensions):
     # Calculate average distance to anchors
     avg_distance = sum(distances.values()) / len(distances)
     
-    # Calculate maximum possible distance in this room
-    max_possible_distance = ((room_dimensions["width_x"]**2 + 
-                            room_dimensions["depth_y"]**2 + 
-                            room_dimensions["height_z"]**2)**0.5)
+    # Maximum possible distance in this room is precomputed with the geometry
+    room_dimensions = geometry.room
     
     # Normalize average distance
-    distance_ratio = avg_distance / max_possible_distance
+    distance_ratio = avg_distance / geometry.room_diagonal
     
     # Use distance ratio and room context to improve height estimate
     if distance_ratio > 0.7:
@@ -104,63 +164,26 @@ def update_sensor_status(distances, current_time):
         if sensor in sensor_status:
             sensor_status[sensor]["color"] = "green"
             sensor_status[sensor]["last_seen"] = current_time
-
-def trilaterate_3d(p1, r1, p2, r2, p3, r3):
-    """
-    3D trilateration using three anchor points
-    p1, p2, p3: anchor positions in mm (x, y, z)
-    r1, r2, r3: distances to anchors in mm
-    Returns: estimated position in mm (x, y, z)
-    """
-    P1 = np.array(p1)
-    P2 = np.array(p2)
-    P3 = np.array(p3)
-    
-    # Calculate the unit vectors
-    ex = (P2 - P1) / np.linalg.norm(P2 - P1)
-    i = np.dot(ex, P3 - P1)
-    ey = P3 - P1 - i * ex
-    ey = ey / np.linalg.norm(ey)
-    ez = np.cross(ex, ey)
-    
-    # Calculate distances between anchors
-    d = np.linalg.norm(P2 - P1)
-    j = np.dot(ey, P3 - P1)
-    
-    # Calculate x and y coordinates
-    x = (r1**2 - r2**2 + d**2) / (2 * d)
-    y = (r1**2 - r3**2 + i**2 + j**2 - 2 * i * x) / (2 * j)
-    
-    # Calculate z coordinate
-    try:
-        z = np.sqrt(abs(r1**2 - x**2 - y**2))
-    except:
-        z = 0
-    
-    # Return 3D position
-    return P1 + x * ex + y * ey + z * ez
+    if dashboard is not None:
+        dashboard.anchors_seen(distances, current_time)
 
 # === 3D Plot Setup ===
-fig = plt.figure(figsize=(14, 10))
-ax_3d = fig.add_subplot(111, projection='3d')
-
-last_position = None
-last_update = time.time()
-current_position = None
+if SHOW_PLOT:
+    fig = plt.figure(figsize=(14, 10))
+    ax_3d = fig.add_subplot(111, projection='3d')
 
-# Interpolation settings
-interp_steps = 5
-interp_counter = 0
-interp_start = None
-interp_end = None
+# Display smoothing per tag: extrapolates along the filter velocity to the
+# render instant and blends out jumps over time, independent of the frame rate
+smoothers = {}
 
-def update_3d_plot(est_3d):
+def update_3d_plot(tag_positions):
     ax_3d.clear()
     
     # Set plot limits in mm
-    ax_3d.set_xlim(0, ROOM_DIMENSIONS["width_x"])
-    ax_3d.set_ylim(0, ROOM_DIMENSIONS["depth_y"])
-    ax_3d.set_zlim(0, ROOM_DIMENSIONS["height_z"])
+    room = geometry.room
+    ax_3d.set_xlim(0, room["width_x"])
+    ax_3d.set_ylim(0, room["depth_y"])
+    ax_3d.set_zlim(0, room["height_z"])
     
     ax_3d.set_title("3D UWB Positioning System", fontsize=14, weight='bold')
     ax_3d.set_xlabel("X (mm)")
@@ -168,7 +191,7 @@ def update_3d_plot(est_3d):
     ax_3d.set_zlabel("Z (mm)")
     
     # Plot anchor positions with sensor icons and status colors
-    for addr, pos in responder_positions_3d.items():
+    for addr, pos in zip(geometry.anchor_ids, geometry.positions):
         color = sensor_status[addr]["color"]
         # Use a sensor-like icon (larger sphere for 3D)
         ax_3d.scatter(pos[0], pos[1], pos[2], c=color, s=300, marker='o', edgecolors='black', linewidth=2)
@@ -178,112 +201,134 @@ def update_3d_plot(est_3d):
         ax_3d.text(pos[0] + 100, pos[1] + 100, pos[2] + 100, f"{addr}\n{status_text}", 
                   fontsize=9, weight='bold')
     
-    # Plot estimated position with tag icon
-    if est_3d is not None:
+    # Plot estimated position of every tag with tag icon
+    for tag, est_3d in tag_positions.items():
         # Use a tag-like icon (diamond shape for 3D)
         ax_3d.scatter(est_3d[0], est_3d[1], est_3d[2], c='blue', s=400, marker='D', edgecolors='black', linewidth=2)
         ax_3d.text(est_3d[0] + 150, est_3d[1] + 150, est_3d[2] + 150, 
-                  f"Tag\n({est_3d[0]/10:.1f}cm, {est_3d[1]/10:.1f}cm, {est_3d[2]/10:.1f}cm)", 
+                  f"{tag}\n({est_3d[0]/10:.1f}cm, {est_3d[1]/10:.1f}cm, {est_3d[2]/10:.1f}cm)", 
                   fontsize=10, weight='bold')
     
     # Add room dimensions text
-    ax_3d.text(50, 50, ROOM_DIMENSIONS["height_z"] - 200, 
-              f"Room: {ROOM_DIMENSIONS['width_x']/10:.1f}cm x {ROOM_DIMENSIONS['depth_y']/10:.1f}cm x {ROOM_DIMENSIONS['height_z']/10:.1f}cm", 
+    ax_3d.text(50, 50, room["height_z"] - 200, 
+              f"Room: {room['width_x']/10:.1f}cm x {room['depth_y']/10:.1f}cm x {room['height_z']/10:.1f}cm", 
               fontsize=9, style='italic')
     
     plt.pause(0.005)
 
+def process_packet(raw_data):
+    """
+    Filter the distances of one in-order packet and trilaterate.
+    Returns (position, velocity in mm/s), or (None, None) if not all
+    anchors were present.
+    """
+    # Extract data (simplified format)
+    distances = geometry.correct_ranges(raw_data.get("distances", {}))
+    timestamp = packet_time(raw_data)
+
+    source = raw_data.get("source", "tag")
+
+    # Sender restarted: its clock is a new timebase, so start its filters over
+    if raw_data.get("session_start"):
+        for key in [key for key in last_time if key[0] == source]:
+            del last_time[key]
+
+    # Update sensor status (liveness is judged on the receiver's clock)
+    update_sensor_status(distances, time.time())
+    
+    print(f"Received raw data: distances={distances}")
+    
+    # Apply Kalman filtering to distances
+    filtered_distances = {}
+    filtered_rates = {}
+    for anchor_addr, distance in distances.items():
+        key = (source, anchor_addr)
+        if key not in kalman_filters or key not in last_time:
+            kalman_filters[key] = create_kalman_filter()
+            kalman_filters[key].x[0] = distance
+            last_time[key] = timestamp
+            filtered_distances[anchor_addr] = distance
+            filtered_rates[anchor_addr] = 0.0
+            continue
+        
+        dt = timestamp - last_time[key]
+        if dt <= 0: 
+            filtered_distances[anchor_addr] = distance
+            filtered_rates[anchor_addr] = kalman_filters[key].x[1, 0]
+            continue
+            
+        last_time[key] = timestamp
+        
+        kf = kalman_filters[key]
+        kf.F[0, 1] = dt
+        kf.Q = Q_discrete_white_noise(dim=2, dt=dt, var=PROCESS_NOISE)
+        
+        kf.predict()
+        kf.update(np.array([[distance]]))
+        
+        filtered_distances[anchor_addr] = kf.x[0, 0]
+        filtered_rates[anchor_addr] = kf.x[1, 0]
+    
+    # Perform 3D trilateration if we have distances to all anchors
+    ranges = geometry.ranges_array(filtered_distances)
+    if ranges is not None:
+        est_3d = geometry.trilaterate_3d(ranges)
+        
+        # Improve height decision using room context
+        improved_height = improve_height_decision(filtered_distances, geometry)
+        est_3d[2] = improved_height
+        
+        new_position_3d = np.array([est_3d[0], est_3d[1], est_3d[2]])
+        print(f"Calculated 3D position: x={new_position_3d[0]/10:.1f}cm, y={new_position_3d[1]/10:.1f}cm, z={new_position_3d[2]/10:.1f}cm")
+        velocity = geometry.velocity_from_range_rates(new_position_3d, geometry.ranges_array(filtered_rates))
+        return new_position_3d, velocity
+    return None, None
+
 try:
     print("Starting 3D UWB Visualizer...")
-    print(f"Room dimensions: {ROOM_DIMENSIONS['width_x']/10:.1f}cm x {ROOM_DIMENSIONS['depth_y']/10:.1f}cm x {ROOM_DIMENSIONS['height_z']/10:.1f}cm")
+    print(f"Room dimensions: {geometry.room['width_x']/10:.1f}cm x {geometry.room['depth_y']/10:.1f}cm x {geometry.room['height_z']/10:.1f}cm")
     print("Waiting for UDP data...")
     print("Sensor Status: Green = Active, Red = Inactive")
     
     while True:
-        got_new = False
+        packets = []
         try:
             data, addr = sock.recvfrom(1024)
             raw_data = json.loads(data.decode())
-            
-            # Extract data (simplified format)
-            distances = raw_data.get("distances", {})
-            timestamp = raw_data.get("timestamp", time.time())
-            
-            # Update sensor status
-            update_sensor_status(distances, timestamp)
-            
-            print(f"Received raw data: distances={distances}")
-            
-            # Apply Kalman filtering to distances
-            filtered_distances = {}
-            for anchor_addr, distance in distances.items():
-                if anchor_addr not in kalman_filters:
-                    kalman_filters[anchor_addr] = create_kalman_filter()
-                    kalman_filters[anchor_addr].x[0] = distance
-                    last_time[anchor_addr] = timestamp
-                    filtered_distances[anchor_addr] = distance
-                    continue
-                
-                dt = timestamp - last_time.get(anchor_addr, timestamp)
-                if dt <= 0: 
-                    filtered_distances[anchor_addr] = distance
-                    continue
-                    
-                last_time[anchor_addr] = timestamp
-                
-                kf = kalman_filters[anchor_addr]
-                kf.F[0, 1] = dt
-                kf.Q = Q_discrete_white_noise(dim=2, dt=dt, var=PROCESS_NOISE)
-                
-                kf.predict()
-                kf.update(np.array([[distance]]))
-                
-                filtered_distances[anchor_addr] = kf.x[0, 0]
-            
-            # Perform 3D trilateration if we have all 3 distances
-            if all(k in filtered_distances for k in responder_positions_3d):
-                d1 = filtered_distances["0x0001"]
-                d2 = filtered_distances["0x0002"]
-                d3 = filtered_distances["0x0003"]
-                
-                est_3d = trilaterate_3d(
-                    responder_positions_3d["0x0001"], d1,
-                    responder_positions_3d["0x0002"], d2,
-                    responder_positions_3d["0x0003"], d3
-                )
-                
-                # Improve height decision using room context
-                improved_height = improve_height_decision(filtered_distances, ROOM_DIMENSIONS)
-                est_3d[2] = improved_height
-                
-                new_position_3d = np.array([est_3d[0], est_3d[1], est_3d[2]])
-                print(f"Calculated 3D position: x={new_position_3d[0]/10:.1f}cm, y={new_position_3d[1]/10:.1f}cm, z={new_position_3d[2]/10:.1f}cm")
-                
-                if current_position is None:
-                    current_position = new_position_3d
-                    interp_start = new_position_3d
-                    interp_end = new_position_3d
-                    interp_counter = 0
-                else:
-                    interp_start = current_position
-                    interp_end = new_position_3d
-                    interp_counter = 0
-                got_new = True
-                
+            raw_data["arrival"] = time.monotonic()
+            packets = sequencer.push(raw_data)
         except socket.timeout:
             pass
+        packets.extend(sequencer.poll())
+        sequencer.print_stats()
+        refresh_geometry()
+
+        for raw_data in packets:
+            new_position_3d, velocity_3d = process_packet(raw_data)
+            if new_position_3d is None:
+                continue
+            tag = raw_data.get("source", "tag")
+            fix_time = time.time()
+            trajectory_store.append(tag, fix_time, new_position_3d)
+            zone_engine.update(tag, fix_time, new_position_3d)
+            # Stamp the fix with its measurement instant, so the smoother and
+            # the resampled output extrapolate over the network and reorder delay
+            measured = sender_clocks.measured_at(raw_data)
+            smoothers.setdefault(tag, DisplaySmoother()).update(measured, new_position_3d, velocity_3d)
+            if fixed_rate_output is not None:
+                fixed_rate_output.update(tag, measured, new_position_3d, velocity_3d)
+            if dashboard is not None:
+                dashboard.update_tag(tag, fix_time, new_position_3d)
+
+        if not SHOW_PLOT:
+            continue
 
-        # Interpolate if we have a new target
-        if interp_start is not None and interp_end is not None:
-            t = min(interp_counter / interp_steps, 1.0)
-            interp_pos = (1 - t) * interp_start + t * interp_end
-            update_3d_plot(interp_pos)
-            current_position = interp_pos
-            if t < 1.0:
-                interp_counter += 1
-        else:
-            # No data yet, just show the plot with inactive sensors
-            update_3d_plot(None)
+        # Draw the smoothed positions for the current instant
+        now = time.monotonic()
+        tag_positions = {tag: smoother.position(now) for tag, smoother in smoothers.items()}
+        update_3d_plot(tag_positions)
+        if not tag_positions:
+            # No data yet, the plot only shows inactive sensors
             time.sleep(0.005)
 except KeyboardInterrupt:
     print("Stopped.")
\ No newline at end of file
@@ -5,25 +5,27 @@ import json
 import time
 from filterpy.kalman import KalmanFilter
 from filterpy.common import Q_discrete_white_noise
+from packet_sequencer import ClockOffset, PacketSequencer, packet_time
+from room_geometry import ConfigWatcher
+from display_smoother import DisplaySmoother
 
-# Room dimensions in mm (x, y) - 2D view
-ROOM_DIMENSIONS = {
-    "width_x": 8428,    # mm (x-axis) - 8.428m
-    "depth_y": 7822,    # mm (y-axis) - 7.822m
-}
-
-# Anchor positions in mm (x, y) - 2D coordinates (top-down view)
-responder_positions_2d = {
-    "0x0001": [2968, 0],      # mm (x, y) - (2.968, 0) m
-    "0x0002": [0, 4007],      # mm (x, y) - (0, 4.007) m
-    "0x0003": [4432, 7375]    # mm (x, y) - (4.432, 7.375) m
-}
+# Room dimensions and anchor positions in mm live in room_config.json (shared
+# with the 3D view, x/y used top-down) and are reloaded when the file changes
+config_watcher = ConfigWatcher().start()
+geometry = config_watcher.geometry
 
 # UDP setup
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5005
+# Set to the sender's multicast group (e.g. "239.255.50.5" for full rate,
+# "239.255.50.6" for 5 Hz) when position_sender.py runs in multicast mode
+MULTICAST_GROUP = None
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 sock.bind((UDP_IP, UDP_PORT))
+if MULTICAST_GROUP:
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                    socket.inet_aton(MULTICAST_GROUP) + socket.inet_aton("0.0.0.0"))
 sock.settimeout(0.005)
 
 # Kalman filter settings
@@ -31,16 +33,16 @@ INITIAL_DT = 0.1
 MEASUREMENT_NOISE = 10
 PROCESS_NOISE = 0.1
 
-# Kalman filters for each anchor
+# Kalman filters for each (source, anchor) pair, so every tag has its own
 kalman_filters = {}
 last_time = {}
 
+# Restores sender order and tracks loss per source
+sequencer = PacketSequencer()
+sender_clocks = ClockOffset()
+
 # Sensor status tracking
-sensor_status = {
-    "0x0001": {"last_seen": 0, "color": "red"},
-    "0x0002": {"last_seen": 0, "color": "red"},
-    "0x0003": {"last_seen": 0, "color": "red"}
-}
+sensor_status = {addr: {"last_seen": 0, "color": "red"} for addr in geometry.anchor_ids}
 
 def create_kalman_filter():
     kf = KalmanFilter(dim_x=2, dim_z=1)
@@ -51,35 +53,29 @@ def create_kalman_filter():
     kf.Q = Q_discrete_white_noise(dim=2, dt=INITIAL_DT, var=PROCESS_NOISE)
     return kf
 
-def trilaterate_2d(p1, r1, p2, r2, p3, r3):
+def refresh_geometry():
     """
-    2D trilateration using three anchor points
-    p1, p2, p3: anchor positions in mm (x, y)
-    r1, r2, r3: distances to anchors in mm
-    Returns: estimated position in mm (x, y)
+    Switch to a reloaded room config. Filters of anchors that kept their
+    position and bias are preserved; changed or removed anchors start over.
     """
-    P1 = np.array(p1)
-    P2 = np.array(p2)
-    P3 = np.array(p3)
-    
-    # Calculate the unit vectors
-    ex = (P2 - P1) / np.linalg.norm(P2 - P1)
-    i = np.dot(ex, P3 - P1)
-    ey = P3 - P1 - i * ex
-    ey = ey / np.linalg.norm(ey)
-    
-    # Calculate distances between anchors
-    d = np.linalg.norm(P2 - P1)
-    j = np.dot(ey, P3 - P1)
-    
-    # Calculate x and y coordinates
-    x = (r1**2 - r2**2 + d**2) / (2 * d)
-    y = (r1**2 - r3**2 + i**2 + j**2 - 2 * i * x) / (2 * j)
-    
-    # Return 2D position
-    return P1 + x * ex + y * ey
+    global geometry
+    new_geometry = config_watcher.geometry
+    if new_geometry is geometry:
+        return
+    changed = set(geometry.changed_anchors(new_geometry))
+    for key in [key for key in kalman_filters if key[1] in changed]:
+        kalman_filters.pop(key, None)
+        last_time.pop(key, None)
+    for addr in changed:
+        print(f"Anchor {addr} changed or removed - filter reset")
+    for addr in list(sensor_status):
+        if addr not in new_geometry.index:
+            del sensor_status[addr]
+    for addr in new_geometry.anchor_ids:
+        sensor_status.setdefault(addr, {"last_seen": 0, "color": "red"})
+    geometry = new_geometry
 
-def estimate_height_2d(distances, room_dimensions):
+def estimate_height_2d(distances, geometry):
     """
     Estimate height based on 2D distance patterns
     This runs on the computer side with full room context
@@ -90,12 +86,8 @@ def estimate_height_2d(distances, room_dimensions):
     # Calculate average distance to anchors
     avg_distance = sum(distances.values()) / len(distances)
     
-    # Calculate maximum possible 2D distance in this room
-    max_2d_distance = ((room_dimensions["width_x"]**2 + 
-                       room_dimensions["depth_y"]**2)**0.5)
-    
-    # Normalize average distance
-    distance_ratio = avg_distance / max_2d_distance
+    # Normalize by the maximum possible 2D distance in this room (precomputed)
+    distance_ratio = avg_distance / geometry.room_diagonal_2d
     
     # Use distance ratio to estimate height
     if distance_ratio > 0.7:
@@ -130,30 +122,30 @@ def update_sensor_status(distances, current_time):
 # === 2D Plot Setup ===
 fig, ax = plt.subplots(figsize=(12, 10))
 
-last_position = None
-last_update = time.time()
-current_position = None
-
-# Interpolation settings
-interp_steps = 5
-interp_counter = 0
-interp_start = None
-interp_end = None
+# Display smoothing per tag: extrapolates along the filter velocity to the
+# render instant and blends out jumps over time, independent of the frame rate
+smoothers = {}
+estimated_heights = {}
 
-def update_2d_plot(est_2d, height_z):
+def update_2d_plot(tag_positions, tag_heights):
     ax.clear()
     
     # Set plot limits in mm
-    ax.set_xlim(0, ROOM_DIMENSIONS["width_x"])
-    ax.set_ylim(0, ROOM_DIMENSIONS["depth_y"])
+    room = geometry.room
+    ax.set_xlim(0, room["width_x"])
+    ax.set_ylim(0, room["depth_y"])
     
-    ax.set_title(f"2D UWB Positioning System (Height: {height_z/10:.1f}cm)", fontsize=14, weight='bold')
+    if len(tag_positions) == 1:
+        height_z = tag_heights[next(iter(tag_positions))]
+        ax.set_title(f"2D UWB Positioning System (Height: {height_z/10:.1f}cm)", fontsize=14, weight='bold')
+    else:
+        ax.set_title("2D UWB Positioning System", fontsize=14, weight='bold')
     ax.set_xlabel("X (mm)")
     ax.set_ylabel("Y (mm)")
     ax.grid(True, alpha=0.3)
     
     # Plot anchor positions with sensor icons and status colors
-    for addr, pos in responder_positions_2d.items():
+    for addr, pos in zip(geometry.anchor_ids, geometry.positions_2d):
         color = sensor_status[addr]["color"]
         # Use a sensor-like icon (filled circle with inner circle)
         ax.scatter(pos[0], pos[1], c=color, s=400, marker='o', edgecolors='black', linewidth=2, zorder=5)
@@ -166,17 +158,17 @@ def update_2d_plot(est_2d, height_z):
         ax.text(pos[0] + 150, pos[1] + 150, f"{addr}\n{status_text}", 
                 fontsize=10, weight='bold', ha='center')
     
-    # Plot estimated position with tag icon
-    if est_2d is not None:
+    # Plot estimated position of every tag with tag icon
+    for tag, est_2d in tag_positions.items():
         # Use a tag-like icon (diamond shape)
         ax.scatter(est_2d[0], est_2d[1], c='blue', s=500, marker='D', edgecolors='black', linewidth=2, zorder=6)
         ax.text(est_2d[0] + 200, est_2d[1] + 200, 
-                f"Tag\n({est_2d[0]/10:.1f}cm, {est_2d[1]/10:.1f}cm)", 
+                f"{tag}\n({est_2d[0]/10:.1f}cm, {est_2d[1]/10:.1f}cm, h {tag_heights[tag]/10:.1f}cm)", 
                 fontsize=10, weight='bold')
     
     # Add room dimensions text
-    ax.text(50, ROOM_DIMENSIONS["depth_y"] - 200, 
-            f"Room: {ROOM_DIMENSIONS['width_x']/10:.1f}cm x {ROOM_DIMENSIONS['depth_y']/10:.1f}cm", 
+    ax.text(50, room["depth_y"] - 200, 
+            f"Room: {room['width_x']/10:.1f}cm x {room['depth_y']/10:.1f}cm", 
             fontsize=10, style='italic')
     
     # Add legend
@@ -189,96 +181,109 @@ def update_2d_plot(est_2d, height_z):
     
     plt.pause(0.005)
 
+def process_packet(raw_data):
+    """
+    Filter the distances of one in-order packet and trilaterate.
+    Returns (position, velocity in mm/s, height), or (None, None, None) if
+    not all anchors were present.
+    """
+    # Extract data (simplified format from Raspberry Pi)
+    distances = geometry.correct_ranges(raw_data.get("distances", {}))
+    timestamp = packet_time(raw_data)
+
+    source = raw_data.get("source", "tag")
+
+    # Sender restarted: its clock is a new timebase, so start its filters over
+    if raw_data.get("session_start"):
+        for key in [key for key in last_time if key[0] == source]:
+            del last_time[key]
+
+    # Update sensor status (liveness is judged on the receiver's clock)
+    update_sensor_status(distances, time.time())
+    
+    print(f"Received 2D raw data: distances={distances}")
+    
+    # Apply Kalman filtering to distances
+    filtered_distances = {}
+    filtered_rates = {}
+    for anchor_addr, distance in distances.items():
+        key = (source, anchor_addr)
+        if key not in kalman_filters or key not in last_time:
+            kalman_filters[key] = create_kalman_filter()
+            kalman_filters[key].x[0] = distance
+            last_time[key] = timestamp
+            filtered_distances[anchor_addr] = distance
+            filtered_rates[anchor_addr] = 0.0
+            continue
+        
+        dt = timestamp - last_time[key]
+        if dt <= 0: 
+            filtered_distances[anchor_addr] = distance
+            filtered_rates[anchor_addr] = kalman_filters[key].x[1, 0]
+            continue
+            
+        last_time[key] = timestamp
+        
+        kf = kalman_filters[key]
+        kf.F[0, 1] = dt
+        kf.Q = Q_discrete_white_noise(dim=2, dt=dt, var=PROCESS_NOISE)
+        
+        kf.predict()
+        kf.update(np.array([[distance]]))
+        
+        filtered_distances[anchor_addr] = kf.x[0, 0]
+        filtered_rates[anchor_addr] = kf.x[1, 0]
+    
+    # Perform 2D trilateration if we have distances to all anchors
+    ranges = geometry.ranges_array(filtered_distances)
+    if ranges is not None:
+        est_2d = geometry.trilaterate_2d(ranges)
+        
+        # Estimate height using 2D distance patterns
+        estimated_height = estimate_height_2d(filtered_distances, geometry)
+        
+        new_position_2d = np.array([est_2d[0], est_2d[1]])
+        print(f"Calculated 2D position: x={new_position_2d[0]/10:.1f}cm, y={new_position_2d[1]/10:.1f}cm, z={estimated_height/10:.1f}cm")
+        velocity = geometry.velocity_from_range_rates(new_position_2d, geometry.ranges_array(filtered_rates))
+        return new_position_2d, velocity, estimated_height
+    return None, None, None
+
 try:
     print("Starting 2D UWB Visualizer...")
-    print(f"Room dimensions: {ROOM_DIMENSIONS['width_x']/10:.1f}cm x {ROOM_DIMENSIONS['depth_y']/10:.1f}cm")
+    print(f"Room dimensions: {geometry.room['width_x']/10:.1f}cm x {geometry.room['depth_y']/10:.1f}cm")
     print("Waiting for UDP data...")
     print("Sensor Status: Green = Active, Red = Inactive")
     
     while True:
-        got_new = False
+        packets = []
         try:
             data, addr = sock.recvfrom(1024)
             raw_data = json.loads(data.decode())
-            
-            # Extract data (simplified format from Raspberry Pi)
-            distances = raw_data.get("distances", {})
-            timestamp = raw_data.get("timestamp", time.time())
-            
-            # Update sensor status
-            update_sensor_status(distances, timestamp)
-            
-            print(f"Received 2D raw data: distances={distances}")
-            
-            # Apply Kalman filtering to distances
-            filtered_distances = {}
-            for anchor_addr, distance in distances.items():
-                if anchor_addr not in kalman_filters:
-                    kalman_filters[anchor_addr] = create_kalman_filter()
-                    kalman_filters[anchor_addr].x[0] = distance
-                    last_time[anchor_addr] = timestamp
-                    filtered_distances[anchor_addr] = distance
-                    continue
-                
-                dt = timestamp - last_time.get(anchor_addr, timestamp)
-                if dt <= 0: 
-                    filtered_distances[anchor_addr] = distance
-                    continue
-                    
-                last_time[anchor_addr] = timestamp
-                
-                kf = kalman_filters[anchor_addr]
-                kf.F[0, 1] = dt
-                kf.Q = Q_discrete_white_noise(dim=2, dt=dt, var=PROCESS_NOISE)
-                
-                kf.predict()
-                kf.update(np.array([[distance]]))
-                
-                filtered_distances[anchor_addr] = kf.x[0, 0]
-            
-            # Perform 2D trilateration if we have all 3 distances
-            if all(k in filtered_distances for k in responder_positions_2d):
-                d1 = filtered_distances["0x0001"]
-                d2 = filtered_distances["0x0002"]
-                d3 = filtered_distances["0x0003"]
-                
-                est_2d = trilaterate_2d(
-                    responder_positions_2d["0x0001"], d1,
-                    responder_positions_2d["0x0002"], d2,
-                    responder_positions_2d["0x0003"], d3
-                )
-                
-                # Estimate height using 2D distance patterns
-                estimated_height = estimate_height_2d(filtered_distances, ROOM_DIMENSIONS)
-                
-                new_position_2d = np.array([est_2d[0], est_2d[1]])
-                print(f"Calculated 2D position: x={new_position_2d[0]/10:.1f}cm, y={new_position_2d[1]/10:.1f}cm, z={estimated_height/10:.1f}cm")
-                
-                if current_position is None:
-                    current_position = new_position_2d
-                    interp_start = new_position_2d
-                    interp_end = new_position_2d
-                    interp_counter = 0
-                else:
-                    interp_start = current_position
-                    interp_end = new_position_2d
-                    interp_counter = 0
-                got_new = True
-                
+            raw_data["arrival"] = time.monotonic()
+            packets = sequencer.push(raw_data)
         except socket.timeout:
             pass
+        packets.extend(sequencer.poll())
+        sequencer.print_stats()
+        refresh_geometry()
+
+        for raw_data in packets:
+            new_position_2d, velocity_2d, new_height = process_packet(raw_data)
+            if new_position_2d is None:
+                continue
+            tag = raw_data.get("source", "tag")
+            estimated_heights[tag] = new_height
+            # Stamp the fix with its measurement instant, so the smoother
+            # extrapolates over the network and reorder delay
+            measured = sender_clocks.measured_at(raw_data)
+            smoothers.setdefault(tag, DisplaySmoother()).update(measured, new_position_2d, velocity_2d)
 
-        # Interpolate if we have a new target
-        if interp_start is not None and interp_end is not None:
-            t = min(interp_counter / interp_steps, 1.0)
-            interp_pos = (1 - t) * interp_start + t * interp_end
-            update_2d_plot(interp_pos, estimated_height)
-            current_position = interp_pos
-            if t < 1.0:
-                interp_counter += 1
-        else:
-            # No data yet, just show the plot with inactive sensors
-            update_2d_plot(None, 1600)
+        # Draw the smoothed positions for the current instant
+        now = time.monotonic()
+        tag_positions = {tag: smoother.position(now) for tag, smoother in smoothers.items()}
+        update_2d_plot(tag_positions, estimated_heights)
+        if not tag_positions:
+            # No data yet, the plot only shows inactive sensors
             time.sleep(0.005)
 except KeyboardInterrupt:
     print("Stopped.") 
\ No newline at end of file
@@ -0,0 +1,443 @@
+import base64
+import hashlib
+import json
+import math
+import select
+import struct
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Dashboard settings
+DASHBOARD_PORT = 8080
+DASHBOARD_RATE_HZ = 20.0     # ticks per second pushed to the browsers
+ANCHOR_TIMEOUT = 2.0         # seconds without data before an anchor shows red
+TAG_STALE_AFTER = 1.0        # seconds without a fix before a tag shows grey
+MAX_QUEUED_FRAMES = 40       # a viewer further behind is resynced with a snapshot
+SEND_TIMEOUT = 5.0           # seconds before a stuck viewer is dropped
+VIEWER_POLL = 0.5            # seconds between checks for frames from an idle viewer
+MAX_CLIENT_FRAME = 4096      # bytes; browsers only send close and ping/pong frames
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def websocket_accept(key):
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+def frame(opcode, payload):
+    """
+    Unmasked, unfragmented WebSocket frame (server to client)
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def text_frame(text):
+    return frame(OPCODE_TEXT, text.encode())
+
+
+def recv_exact(sock, count):
+    data = b""
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("viewer closed the connection")
+        data += chunk
+    return data
+
+
+def read_frame(sock):
+    """
+    One masked frame from a browser, returns (opcode, payload)
+    """
+    first, second = recv_exact(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", recv_exact(sock, 8))[0]
+    if length > MAX_CLIENT_FRAME:
+        raise ConnectionError("viewer frame too large")
+    mask = recv_exact(sock, 4) if second & 0x80 else b"\0\0\0\0"
+    payload = recv_exact(sock, length)
+    return first & 0x0F, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+class Viewer:
+    """
+    One connected browser: a queue of encoded frames drained by the
+    viewer's own connection thread
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.frames = deque()
+        self.ready = threading.Condition()
+        self.needs_snapshot = True
+
+
+class Dashboard:
+    """
+    Browser dashboard served from the positioning engine.
+
+    The engine only stores the latest fix per tag and the last-seen time per
+    anchor. A separate tick thread turns the changes since the previous tick
+    into one JSON delta, encodes it once as a WebSocket frame and appends
+    the same bytes to every viewer queue, so viewers cost the engine
+    nothing and each other almost nothing. New or lagging viewers get a
+    full snapshot instead. Plain HTTP serves the page, the current state
+    and, with a trajectory store, history and heatmap queries.
+    """
+    def __init__(self, geometry, port=DASHBOARD_PORT, rate_hz=DASHBOARD_RATE_HZ, trajectory_store=None):
+        self.geometry = geometry
+        self.port = port
+        self.period = 1.0 / rate_hz
+        self.trajectory_store = trajectory_store
+        self.state_lock = threading.Lock()
+        self.tags = {}           # tag -> (t, position) as reported by the engine
+        self.anchor_seen = {}    # anchor -> t
+        self.geometry_changed = False
+        self.sent_tags = {}      # tag -> [x, y, z] as last sent
+        self.sent_stale = {}
+        self.sent_anchors = {}
+        self.tick_lock = threading.Lock()   # guards the sent_* state
+        self.viewers = []
+        self.viewers_lock = threading.Lock()
+        self.server = None
+
+    # Engine side: cheap, called from the estimation loop
+
+    def update_tag(self, tag, t, position):
+        with self.state_lock:
+            self.tags[tag] = (t, position)
+
+    def anchors_seen(self, anchors, t):
+        with self.state_lock:
+            for addr in anchors:
+                self.anchor_seen[addr] = t
+
+    def set_geometry(self, geometry):
+        with self.state_lock:
+            self.geometry = geometry
+            self.geometry_changed = True
+
+    # Server side
+
+    def start(self):
+        """
+        Start serving. Returns self, or None if the port cannot be bound, so
+        the engine keeps positioning without a dashboard.
+        """
+        handler = type("Handler", (DashboardHandler,), {"dashboard": self})
+        try:
+            self.server = ThreadingHTTPServer(("0.0.0.0", self.port), handler)
+        except OSError as e:
+            print(f"Dashboard disabled, cannot listen on port {self.port}: {e}")
+            return None
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._tick_loop, daemon=True).start()
+        print(f"Dashboard on http://0.0.0.0:{self.port}/")
+        return self
+
+    def _tick_loop(self):
+        deadline = time.monotonic()
+        while True:
+            deadline += self.period
+            time.sleep(max(deadline - time.monotonic(), 0.0))
+            try:
+                with self.tick_lock:
+                    self.tick(time.time())
+            except Exception as e:
+                print(f"Dashboard tick failed: {e}")
+
+    def tick(self, now):
+        with self.state_lock:
+            tags = dict(self.tags)
+            anchor_seen = dict(self.anchor_seen)
+            geometry = self.geometry
+            resync = self.geometry_changed
+            self.geometry_changed = False
+
+        delta = {"type": "delta", "t": round(now, 3)}
+        moved = {}
+        for tag, (t, position) in tags.items():
+            rounded = [int(round(float(v))) for v in position]
+            if self.sent_tags.get(tag) != rounded:
+                moved[tag] = self.sent_tags[tag] = rounded
+        stale = {}
+        for tag, (t, position) in tags.items():
+            is_stale = now - t > TAG_STALE_AFTER
+            if self.sent_stale.get(tag) != is_stale:
+                stale[tag] = self.sent_stale[tag] = is_stale
+        anchors = {}
+        for addr in geometry.anchor_ids:
+            active = now - anchor_seen.get(addr, 0.0) < ANCHOR_TIMEOUT
+            if self.sent_anchors.get(addr) != active:
+                anchors[addr] = self.sent_anchors[addr] = active
+        for name, changes in (("tags", moved), ("stale", stale), ("anchors", anchors)):
+            if changes:
+                delta[name] = changes
+        delta_frame = text_frame(json.dumps(delta)) if len(delta) > 2 else None
+
+        with self.viewers_lock:
+            viewers = list(self.viewers)
+        snapshot_frame = None
+        for viewer in viewers:
+            with viewer.ready:
+                if resync or viewer.needs_snapshot or len(viewer.frames) >= MAX_QUEUED_FRAMES:
+                    if snapshot_frame is None:
+                        snapshot_frame = text_frame(json.dumps(self.snapshot(now, geometry)))
+                    viewer.frames.clear()
+                    viewer.frames.append(snapshot_frame)
+                    viewer.needs_snapshot = False
+                elif delta_frame is not None:
+                    viewer.frames.append(delta_frame)
+                else:
+                    continue
+                viewer.ready.notify()
+
+    def snapshot(self, now, geometry=None):
+        """
+        Full state as last sent: room, anchors, zones and tags
+        """
+        geometry = geometry or self.geometry
+        return {
+            "type": "snapshot",
+            "t": round(now, 3),
+            "room": geometry.room,
+            "anchors": {addr: {"position": [float(v) for v in geometry.positions[i]],
+                               "active": self.sent_anchors.get(addr, False)}
+                        for i, addr in enumerate(geometry.anchor_ids)},
+            "zones": [zone.spec for zone in geometry.zones],
+            "tags": dict(self.sent_tags),
+            "stale": dict(self.sent_stale),
+        }
+
+    def serve_viewer(self, sock):
+        """
+        Drain frames to one WebSocket viewer until it goes away. Between
+        frames the socket is checked every VIEWER_POLL seconds, so a viewer
+        that closes or disconnects is dropped even while nothing changes.
+        """
+        viewer = Viewer(sock)
+        sock.settimeout(SEND_TIMEOUT)
+        with self.viewers_lock:
+            self.viewers.append(viewer)
+        print(f"Dashboard viewer connected ({len(self.viewers)} watching)")
+        try:
+            while True:
+                with viewer.ready:
+                    if not viewer.frames:
+                        viewer.ready.wait(VIEWER_POLL)
+                    frames = list(viewer.frames)
+                    viewer.frames.clear()
+                if frames:
+                    sock.sendall(b"".join(frames))
+                if not select.select([sock], [], [], 0)[0]:
+                    continue
+                opcode, payload = read_frame(sock)
+                if opcode == OPCODE_CLOSE:
+                    sock.sendall(frame(OPCODE_CLOSE, payload[:2]))
+                    break
+                if opcode == OPCODE_PING:
+                    sock.sendall(frame(OPCODE_PONG, payload))
+        except OSError:
+            pass
+        finally:
+            with self.viewers_lock:
+                self.viewers.remove(viewer)
+            print(f"Dashboard viewer left ({len(self.viewers)} watching)")
+
+    def history(self, tag, seconds):
+        now = time.time()
+        times, points = self.trajectory_store.query(tag, now - seconds, now + 1.0)
+        return {"tag": tag, "t": times.round(3).tolist(), "position": points.round(0).tolist()}
+
+    def heatmap(self, tag=None):
+        from trajectory_store import OCCUPANCY_CELL_MM
+        grid = self.trajectory_store.heatmap(tag)
+        return {"tag": tag, "cell_mm": OCCUPANCY_CELL_MM, "seconds": grid.round(2).tolist()}
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # browsers reject a 101 upgrade on HTTP/1.0
+    dashboard = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/ws":
+            return self.upgrade()
+        if url.path in ("/", "/index.html"):
+            return self.reply(200, DASHBOARD_HTML.encode(), "text/html; charset=utf-8")
+        if url.path == "/api/state":
+            with self.dashboard.tick_lock:
+                state = self.dashboard.snapshot(time.time())
+            return self.reply_json(state)
+        if url.path in ("/api/history", "/api/heatmap") and self.dashboard.trajectory_store is not None:
+            tag = query.get("tag", [None])[0]
+            if url.path == "/api/heatmap":
+                return self.reply_json(self.dashboard.heatmap(tag))
+            if tag is None:
+                return self.reply(400, b"tag required", "text/plain")
+            try:
+                seconds = float(query.get("seconds", ["60"])[0])
+            except ValueError:
+                seconds = math.nan
+            if not math.isfinite(seconds) or seconds <= 0:
+                return self.reply(400, b"seconds must be a positive number", "text/plain")
+            return self.reply_json(self.dashboard.history(tag, seconds))
+        self.reply(404, b"not found", "text/plain")
+
+    def upgrade(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            return self.reply(400, b"websocket upgrade expected", "text/plain")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", websocket_accept(key))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        self.dashboard.serve_viewer(self.connection)
+
+    def reply_json(self, data):
+        self.reply(200, json.dumps(data).encode(), "application/json")
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep the engine console for positioning output
+
+
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>UWB Positioning</title>
+<style>
+  body { margin: 0; font-family: sans-serif; background: #f4f4f4; }
+  #bar { padding: 6px 10px; background: #222; color: #eee; font-size: 14px; }
+  #bar button { margin-left: 10px; }
+  canvas { display: block; margin: 0 auto; background: #fff; }
+</style>
+</head>
+<body>
+<div id="bar">UWB Positioning &mdash; <span id="status">connecting...</span>
+  <button id="heat">Heatmap</button></div>
+<canvas id="room"></canvas>
+<script>
+const canvas = document.getElementById("room");
+const ctx = canvas.getContext("2d");
+let room = null, anchors = {}, zones = [], tags = {}, stale = {}, heat = null;
+const shown = {}, trails = {};
+
+function applySnapshot(m) {
+  room = m.room; anchors = m.anchors; zones = m.zones; tags = m.tags; stale = m.stale;
+  resize();
+}
+function applyDelta(m) {
+  Object.assign(tags, m.tags || {});
+  Object.assign(stale, m.stale || {});
+  for (const [addr, active] of Object.entries(m.anchors || {}))
+    if (anchors[addr]) anchors[addr].active = active;
+  for (const [tag, p] of Object.entries(m.tags || {})) {
+    (trails[tag] = trails[tag] || []).push(p);
+    if (trails[tag].length > 200) trails[tag].shift();
+  }
+}
+function connect() {
+  const ws = new WebSocket(`ws://${location.host}/ws`);
+  ws.onopen = () => document.getElementById("status").textContent = "live";
+  ws.onclose = () => { document.getElementById("status").textContent = "reconnecting..."; setTimeout(connect, 1000); };
+  ws.onmessage = (e) => { const m = JSON.parse(e.data); m.type === "snapshot" ? applySnapshot(m) : applyDelta(m); };
+}
+
+let scale = 1, pad = 30;
+function resize() {
+  if (!room) return;
+  const w = window.innerWidth, h = window.innerHeight - 40;
+  scale = Math.min((w - 2 * pad) / room.width_x, (h - 2 * pad) / room.depth_y);
+  canvas.width = room.width_x * scale + 2 * pad;
+  canvas.height = room.depth_y * scale + 2 * pad;
+}
+// Room y grows upwards like the matplotlib view
+const sx = (x) => pad + x * scale, sy = (y) => canvas.height - pad - y * scale;
+
+function draw() {
+  requestAnimationFrame(draw);
+  if (!room) return;
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (heat) {
+    const max = Math.max(...heat.seconds.flat(), 1e-9), c = heat.cell_mm * scale;
+    heat.seconds.forEach((col, i) => col.forEach((v, j) => {
+      if (v <= 0) return;
+      ctx.fillStyle = `rgba(255,80,0,${Math.sqrt(v / max) * 0.8})`;
+      ctx.fillRect(sx(i * heat.cell_mm), sy((j + 1) * heat.cell_mm), c, c);
+    }));
+  }
+  ctx.strokeStyle = "#000"; ctx.lineWidth = 2;
+  ctx.strokeRect(sx(0), sy(room.depth_y), room.width_x * scale, room.depth_y * scale);
+  ctx.lineWidth = 1; ctx.strokeStyle = "#36c"; ctx.setLineDash([5, 4]);
+  for (const z of zones) {
+    ctx.beginPath();
+    const pts = z.type === "polygon" ? z.points :
+      [[z.min[0], z.min[1]], [z.max[0], z.min[1]], [z.max[0], z.max[1]], [z.min[0], z.max[1]]];
+    pts.forEach((p, i) => i ? ctx.lineTo(sx(p[0]), sy(p[1])) : ctx.moveTo(sx(p[0]), sy(p[1])));
+    ctx.closePath(); ctx.stroke();
+    ctx.fillStyle = "#36c"; ctx.fillText(z.id, sx(pts[0][0]) + 4, sy(pts[0][1]) - 4);
+  }
+  ctx.setLineDash([]);
+  for (const [addr, a] of Object.entries(anchors)) {
+    ctx.beginPath(); ctx.arc(sx(a.position[0]), sy(a.position[1]), 9, 0, 2 * Math.PI);
+    ctx.fillStyle = a.active ? "green" : "red"; ctx.fill(); ctx.strokeStyle = "#000"; ctx.stroke();
+    ctx.fillStyle = "#000"; ctx.fillText(addr, sx(a.position[0]) + 12, sy(a.position[1]) - 8);
+  }
+  for (const [tag, target] of Object.entries(tags)) {
+    // Ease towards the latest fix so ticks do not show as steps
+    const p = shown[tag] = shown[tag] || target.slice();
+    for (let i = 0; i < 3; i++) p[i] += (target[i] - p[i]) * 0.3;
+    const trail = trails[tag] || [];
+    ctx.strokeStyle = "rgba(0,0,255,0.25)"; ctx.beginPath();
+    trail.forEach((q, i) => i ? ctx.lineTo(sx(q[0]), sy(q[1])) : ctx.moveTo(sx(q[0]), sy(q[1])));
+    ctx.stroke();
+    ctx.save(); ctx.translate(sx(p[0]), sy(p[1])); ctx.rotate(Math.PI / 4);
+    ctx.fillStyle = stale[tag] ? "#999" : "blue"; ctx.fillRect(-7, -7, 14, 14); ctx.restore();
+    ctx.fillStyle = "#000";
+    ctx.fillText(`${tag} (${(p[0] / 10).toFixed(1)}, ${(p[1] / 10).toFixed(1)}, ${(p[2] / 10).toFixed(1)}) cm`,
+                 sx(p[0]) + 12, sy(p[1]) + 4);
+  }
+}
+document.getElementById("heat").onclick = async () => {
+  if (heat) { heat = null; return; }
+  const r = await fetch("/api/heatmap");
+  if (r.ok) heat = await r.json();
+};
+window.onresize = resize;
+connect();
+draw();
+</script>
+</body>
+</html>
+"""
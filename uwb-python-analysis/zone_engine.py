@@ -0,0 +1,245 @@
+import json
+import socket
+import time
+import numpy as np
+
+# Zone engine settings
+ZONE_INDEX_CELL_MM = 500.0   # grid cell size of the zone index
+DEFAULT_HYSTERESIS_MM = 150.0
+DEFAULT_DWELL_S = 10.0
+
+
+class Zone:
+    """
+    A box or a polygon (top-down, with an optional z range) in room mm.
+
+    Config forms:
+        {"id": "desk", "type": "box", "min": [x, y, z], "max": [x, y, z]}
+        {"id": "door", "type": "polygon", "points": [[x, y], ...], "z_range": [z_min, z_max]}
+    Optional: "hysteresis_mm" (how far outside the tag must be to exit),
+    "dwell_s" (time inside before a dwell event, 0 disables it).
+    """
+    def __init__(self, spec):
+        if not isinstance(spec, dict) or "id" not in spec:
+            raise ValueError(f"zone {spec!r}: needs to be an object with an 'id'")
+        self.id = spec["id"]
+        self.kind = spec.get("type", "box")
+        self.hysteresis = float(self._numbers(spec, "hysteresis_mm", (), DEFAULT_HYSTERESIS_MM))
+        self.dwell = float(self._numbers(spec, "dwell_s", (), DEFAULT_DWELL_S))
+        self.spec = spec
+
+        if self.kind == "box":
+            self.lo = self._numbers(spec, "min", (3,))
+            self.hi = self._numbers(spec, "max", (3,))
+            if np.any(self.lo > self.hi):
+                raise ValueError(f"zone {self.id}: min must not exceed max")
+        elif self.kind == "polygon":
+            points = self._numbers(spec, "points", (None, 2))
+            if len(points) < 3:
+                raise ValueError(f"zone {self.id}: a polygon needs at least 3 points")
+            z_min, z_max = self._numbers(spec, "z_range", (2,), [-np.inf, np.inf])
+            # Edges as (ax, ay, bx - ax, by - ay, squared length) tuples; polygons
+            # are small, so plain float math beats numpy call overhead here
+            b = np.roll(points, -1, axis=0)
+            self.edges = [(float(ax), float(ay), float(bx - ax), float(by - ay),
+                           max(float((bx - ax)**2 + (by - ay)**2), 1e-12))
+                          for (ax, ay), (bx, by) in zip(points, b)]
+            self.lo = np.array([points[:, 0].min(), points[:, 1].min(), z_min])
+            self.hi = np.array([points[:, 0].max(), points[:, 1].max(), z_max])
+        else:
+            raise ValueError(f"zone {self.id}: unknown type {self.kind}")
+
+    def _numbers(self, spec, key, shape, default=None):
+        """
+        spec[key] as a float array of the given shape (None = any length),
+        or ValueError naming the zone and key
+        """
+        value = spec.get(key, default)
+        if value is None:
+            raise ValueError(f"zone {self.id}: '{key}' is missing")
+        try:
+            array = np.array(value, dtype=float)
+        except (TypeError, ValueError):
+            array = None
+        if (array is None or array.ndim != len(shape) or
+                any(n is not None and n != m for n, m in zip(shape, array.shape)) or
+                np.any(np.isnan(array)) or isinstance(value, bool)):
+            raise ValueError(f"zone {self.id}: '{key}' has the wrong form")
+        return array
+
+    def distance_outside(self, p):
+        """
+        0 if p is inside, otherwise the distance in mm to the zone
+        """
+        if self.kind == "box":
+            return float(np.linalg.norm(np.maximum(np.maximum(self.lo - p, p - self.hi), 0.0)))
+
+        x, y, z = float(p[0]), float(p[1]), float(p[2])
+        z_out = max(self.lo[2] - z, z - self.hi[2], 0.0)
+        inside = False
+        nearest = float("inf")
+        for ax, ay, dx, dy, length2 in self.edges:
+            # Even-odd rule
+            if (ay > y) != (ay + dy > y) and x < dx * (y - ay) / dy + ax:
+                inside = not inside
+            t = min(max(((x - ax) * dx + (y - ay) * dy) / length2, 0.0), 1.0)
+            ex = ax + t * dx - x
+            ey = ay + t * dy - y
+            nearest = min(nearest, ex * ex + ey * ey)
+        if inside:
+            return z_out
+        return (nearest + z_out**2)**0.5
+
+
+class ZoneVisit:
+    """
+    Per tag and zone: when the tag entered and whether dwell was reported
+    """
+    def __init__(self, t, spec):
+        self.entered = t
+        self.spec = spec
+        self.dwell_sent = False
+
+
+class ZoneEngine:
+    """
+    Tests every fix against the configured zones and emits enter, exit and
+    dwell events.
+
+    Zones are bucketed into a uniform grid by their bounding box grown by
+    their hysteresis, so a fix only tests the few zones in its own cell. A
+    tag enters a zone when it is inside it and exits only once it is more
+    than hysteresis_mm outside, which stops boundary jitter from producing
+    event storms. Events go to every registered listener.
+    """
+    def __init__(self, zones=(), cell_mm=ZONE_INDEX_CELL_MM):
+        self.cell_mm = cell_mm
+        self.listeners = []
+        self.visits = {}     # tag -> {zone id: ZoneVisit}
+        self.set_zones(zones)
+
+    def set_zones(self, zone_specs):
+        """
+        Replace the zone set. Tags stay inside zones that still exist with
+        the same definition; visits of removed or changed zones are dropped
+        without an exit event.
+        """
+        zones = [spec if isinstance(spec, Zone) else Zone(spec) for spec in zone_specs]
+        self.zones = {zone.id: zone for zone in zones}
+        self.zone_list = zones
+
+        cells = {}
+        for i, zone in enumerate(zones):
+            lo = zone.lo[:2] - zone.hysteresis
+            hi = zone.hi[:2] + zone.hysteresis
+            for cx in range(int(np.floor(lo[0] / self.cell_mm)), int(np.floor(hi[0] / self.cell_mm)) + 1):
+                for cy in range(int(np.floor(lo[1] / self.cell_mm)), int(np.floor(hi[1] / self.cell_mm)) + 1):
+                    cells.setdefault((cx, cy), []).append(i)
+        # Per cell: zone indices and their bounding boxes grown by the
+        # hysteresis, so one vectorised test discards most candidates. For
+        # boxes the ungrown bounds give the exact distance in the same pass.
+        self.cells = {}
+        for key, members in cells.items():
+            members = np.array(members, dtype=np.intp)
+            lo = np.array([zones[i].lo for i in members])
+            hi = np.array([zones[i].hi for i in members])
+            grow = np.array([zones[i].hysteresis for i in members])[:, None]
+            is_box = np.array([zones[i].kind == "box" for i in members])
+            self.cells[key] = (members, lo, hi, lo - grow, hi + grow, is_box)
+
+        for tag, visits in self.visits.items():
+            for zone_id in list(visits):
+                zone = self.zones.get(zone_id)
+                if zone is None or zone.spec != visits[zone_id].spec:
+                    del visits[zone_id]
+
+    def add_listener(self, callback):
+        """
+        callback(event) is called for every event; event is a dict with
+        "event" ("enter", "exit", "dwell"), "zone", "tag", "t" and "position"
+        """
+        self.listeners.append(callback)
+
+    def _emit(self, kind, zone, tag, t, position):
+        event = {"event": kind, "zone": zone.id, "tag": tag, "t": t,
+                 "position": [round(float(v), 1) for v in position]}
+        for callback in self.listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Zone event listener failed: {e}")
+
+    def update(self, tag, t, position):
+        """
+        Evaluate one fix of tag at time t. Returns the number of events emitted.
+        """
+        p = np.asarray(position, dtype=float)
+        visits = self.visits.setdefault(tag, {})
+        key = (int(p[0] // self.cell_mm), int(p[1] // self.cell_mm))
+        cell = self.cells.get(key)
+        candidates = ()
+        distances = ()
+        if cell is not None:
+            members, lo, hi, grown_lo, grown_hi, is_box = cell
+            near = np.all((grown_lo <= p) & (p <= grown_hi), axis=1)
+            candidates = members[near]
+            box_out = np.maximum(np.maximum(lo[near] - p, p - hi[near]), 0.0)
+            distances = np.where(is_box[near], np.sqrt(np.sum(box_out**2, axis=1)), -1.0).tolist()
+        emitted = 0
+
+        seen = set()
+        for i, outside in zip(candidates, distances):
+            zone = self.zone_list[i]
+            seen.add(zone.id)
+            if outside < 0.0:
+                outside = zone.distance_outside(p)
+            visit = visits.get(zone.id)
+            if visit is None:
+                if outside > 0.0:
+                    continue
+                visit = visits[zone.id] = ZoneVisit(t, zone.spec)
+                self._emit("enter", zone, tag, t, p)
+                emitted += 1
+            elif outside > zone.hysteresis:
+                del visits[zone.id]
+                self._emit("exit", zone, tag, t, p)
+                emitted += 1
+                continue
+            if not visit.dwell_sent and zone.dwell > 0 and t - visit.entered >= zone.dwell:
+                visit.dwell_sent = True
+                self._emit("dwell", zone, tag, t, p)
+                emitted += 1
+
+        # Zones outside their grown bounding box are further away than their hysteresis
+        for zone_id in [z for z in visits if z not in seen]:
+            del visits[zone_id]
+            self._emit("exit", self.zones[zone_id], tag, t, p)
+            emitted += 1
+        return emitted
+
+    def occupants(self, zone_id):
+        """
+        Tags currently inside a zone
+        """
+        return [tag for tag, visits in self.visits.items() if zone_id in visits]
+
+
+def unix_socket_listener(path):
+    """
+    Listener that sends every event as a JSON datagram to a Unix socket.
+    A missing receiver is ignored, so consumers can come and go.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+
+    def send(event):
+        try:
+            sock.sendto(json.dumps(event).encode(), path)
+        except OSError:
+            pass
+    return send
+
+
+def print_listener(event):
+    print(f"Zone {event['event']}: {event['tag']} {event['zone']} "
+          f"at {time.strftime('%H:%M:%S', time.localtime(event['t']))}")